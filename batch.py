@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import glob
+import signal
+import fnmatch
+import logging
+import argparse
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipeline
+
+
+SIMULATIONS_DIR = os.path.join(pipeline.PARENT_DIR, "data", "simulations")
+SIMULATION_DIR_PATTERN = re.compile(r"simulation_(.+)_([^_]+)")
+RANGE_PATTERN = re.compile(r"(\d+)-(\d+)")
+
+parser = argparse.ArgumentParser(description="Builds containers.csv for many simulations (see pipeline.py), their jobs being run by a pool of processes which each load the referential data once")
+parser.add_argument("simulations", type=str, nargs="+", help="Simulations to run: numbers (e.g. 164), ranges (e.g. 100-199, only the existing simulations are run) or globs over the data/simulations directories (e.g. 'simulation_1*_prod' or '*')")
+parser.add_argument("--env", "-e", type=str, default="prod", help="Environment of the simulations given by number or range (prod or dev)")
+parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of processes running simulations (1 runs them in the main process)")
+parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a simulation job is stopped and reported as timed out. No timeout if not given")
+parser.add_argument("--summary", type=str, default=os.path.join(pipeline.PARENT_DIR, "output_data", "batch_summary.json"), help="JSON file the status, duration and containers count of each simulation are written to")
+parser.add_argument("--raw-text", type=str, default="omit", choices=list(pipeline.runner.RAW_TEXT_COLUMNS), help="See pipeline.py --raw-text")
+parser.add_argument("--handoff", type=str, default="auto", choices=pipeline.HANDOFFS, help="See pipeline.py --handoff")
+parser.add_argument("--full-parse", action="store_true", help="See pipeline.py --full-parse")
+parser.add_argument("--debug-json", action="store_true", help="See pipeline.py --debug-json")
+parser.add_argument("--log-level", type=str, default="WARNING", choices=pipeline.logging_utils.LOG_LEVELS, help="Log level of all modules")
+parser.add_argument("--log-module", type=str, action="append", default=[], help="Log level of one module, as module=LEVEL (e.g. batch=INFO). Can be repeated")
+
+logger = logging.getLogger("batch")
+
+
+class JobTimeoutError(BaseException):
+    """Raised in a job by its timeout. Not an Exception, so that the pipeline error handlers (e.g. of segments groups failing to parse) do not catch it."""
+
+
+def resolve_simulations(selectors, env="prod", simulations_dir=SIMULATIONS_DIR):
+    """Returns the (simulation, env) of the selectors, in order and without duplicates: a number, a range of numbers
+    (the simulations of env having a directory) or a glob over the simulation_{simulation}_{env} directories names."""
+    existing = sorted(os.path.basename(path) for path in glob.glob(os.path.join(simulations_dir, "simulation_*_*")))
+
+    simulations = []
+    for selector in selectors:
+        range_match = RANGE_PATTERN.fullmatch(selector)
+
+        if glob.has_magic(selector):
+            matches = [SIMULATION_DIR_PATTERN.fullmatch(name).groups() for name in fnmatch.filter(existing, selector) if SIMULATION_DIR_PATTERN.fullmatch(name)]
+            if not matches:
+                logger.warning("No simulation directory matches %s in %s", selector, simulations_dir)
+        elif range_match:
+            first, last = int(range_match.group(1)), int(range_match.group(2))
+            matches = [(str(simulation), env) for simulation in range(first, last + 1) if f"simulation_{simulation}_{env}" in existing]
+        else:
+            matches = [(selector, env)]
+
+        simulations += [match for match in matches if match not in simulations]
+
+    return simulations
+
+
+def initialize_batch_worker(logging_configuration=None):
+    """Process pool initializer: applies the logging configuration of the parent process and loads the referential data once."""
+    if logging_configuration is not None:
+        pipeline.logging_utils.configure_logging(*logging_configuration)
+
+    pipeline.runner.load_referentials(pipeline.PARENT_DIR)
+
+
+def raise_job_timeout(signum, frame):
+    raise JobTimeoutError("Simulation job timed out")
+
+
+def run_simulation_job(simulation, env, timeout=None, **pipeline_options):
+    """Runs the pipeline of a simulation, returns its summary (status ok, failed or timeout, duration, containers count or error).
+    The timeout is raised in the job by SIGALRM, so that the worker process goes on with the next jobs."""
+    summary = {"simulation": simulation, "env": env}
+    start_time = time.perf_counter()
+
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_job_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        try:
+            df_containers = pipeline.run_pipeline(simulation, env, progress="none", **pipeline_options)
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        summary.update(status="ok", containers=len(df_containers))
+    except JobTimeoutError:
+        summary.update(status="timeout", error=f"Timed out after {timeout}s")
+    except Exception:
+        summary.update(status="failed", error=traceback.format_exc())
+
+    summary["duration"] = round(time.perf_counter() - start_time, 3)
+
+    return summary
+
+
+def run_batch(simulations, jobs=1, timeout=None, **pipeline_options):
+    """Runs the pipeline of each (simulation, env), jobs at a time, returns their summaries in simulations order."""
+    summaries = {}
+
+    def report(summary):
+        summaries[(summary["simulation"], summary["env"])] = summary
+        log = logger.info if summary["status"] == "ok" else logger.error
+        log("Simulation %s %s %s in %ss (%s/%s) %s", summary["simulation"], summary["env"], summary["status"], summary["duration"], len(summaries), len(simulations), summary.get("error", ""))
+
+    if jobs <= 1:
+        initialize_batch_worker()
+        for simulation, env in simulations:
+            try:
+                summary = run_simulation_job(simulation, env, timeout, **pipeline_options)
+            except JobTimeoutError:
+                summary = {"simulation": simulation, "env": env, "status": "timeout", "error": f"Timed out after {timeout}s", "duration": None}
+            report(summary)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_batch_worker, initargs=(pipeline.logging_utils.logging_configuration,)) as executor:
+            futures = {executor.submit(run_simulation_job, simulation, env, timeout, **pipeline_options): (simulation, env) for simulation, env in simulations}
+
+            for future in as_completed(futures):
+                simulation, env = futures[future]
+                try:
+                    summary = future.result()
+                except JobTimeoutError:
+                    summary = {"simulation": simulation, "env": env, "status": "timeout", "error": f"Timed out after {timeout}s", "duration": None}
+                except Exception:
+                    # The worker running the job died
+                    summary = {"simulation": simulation, "env": env, "status": "failed", "error": traceback.format_exc(), "duration": None}
+                report(summary)
+
+    return [summaries[simulation] for simulation in simulations]
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    pipeline.logging_utils.configure_logging(args.log_level, {"batch": "INFO", **pipeline.logging_utils.parse_module_levels(args.log_module)})
+
+    simulations = resolve_simulations(args.simulations, args.env)
+    logger.info("Run %s simulations with %s jobs", len(simulations), args.jobs)
+
+    start_time = time.perf_counter()
+    summaries = run_batch(
+        simulations,
+        jobs=args.jobs,
+        timeout=args.timeout,
+        raw_text=args.raw_text,
+        handoff=args.handoff,
+        full_parse=args.full_parse,
+        debug_json=args.debug_json,
+    )
+
+    statuses = [summary["status"] for summary in summaries]
+    report = {
+        "duration": round(time.perf_counter() - start_time, 3),
+        "counts": {status: statuses.count(status) for status in ("ok", "failed", "timeout")},
+        "simulations": summaries,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.summary)), exist_ok=True)
+    with open(args.summary, "w") as f:
+        json.dump(report, f, indent=2)
+
+    logger.info("Ran %s simulations in %ss: %s, summary written to %s", len(summaries), report["duration"], report["counts"], args.summary)
@@ -1,17 +1,216 @@
+import time
+import logging
 import traceback
-from pprint import pprint
 
-from typing import get_origin
-from dataclasses import dataclass, fields, is_dataclass
+from collections import deque
+from itertools import count, islice, takewhile
+from typing import Iterable, Union
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, is_dataclass, MISSING, FrozenInstanceError
 
 from utils import python_utils
 from utils import parsing_utils
+from utils import metrics_utils
+from utils import logging_utils
 
-from pydifact.segmentcollection import RawSegmentCollection
 
-@dataclass
+# Kinds of segment group fields
+SEGMENT = "segment"
+SEGMENTS_LIST = "segments_list"
+SEGMENT_GROUP = "segment_group"
+SEGMENT_GROUPS_LIST = "segment_groups_list"
+EDI_STRING = "edi_string"
+
+logger = logging.getLogger(__name__)
+
+
+# Number of segments groups sent at once to a parsing worker
+DEFAULT_PARSE_CHUNK_SIZE = 64
+
+
+@dataclass(frozen=True)
+class ElementParsePlan:
+  """Parses one element of a segment into the field at the same position.
+  Composite elements have a parser, typed values (e.g. float or int annotations) and code strings a decoder.
+  A missing composite element whose default is an empty composite gets the shared empty sentinel of its parser."""
+  name: str
+  parser: type = None
+  decoder: object = None
+  default_to_empty_sentinel: bool = False
+
+
+@dataclass(frozen=True)
+class SegmentParsePlan:
+  elements: tuple
+  required_fields_names: tuple
+
+
+@dataclass(frozen=True)
+class FieldParsePlan:
+  """Collects and parses one field of a segment group. parser is the SegmentParser or SegmentGroupParser of its values."""
+  name: str
+  kind: str
+  parser: type
+  default_factory: object
+  is_main_segment: bool = False
+
+
+@dataclass(frozen=True)
+class SegmentGroupParsePlan:
+  fields: tuple
+  routes: MappingProxyType
+  main_segment_field: FieldParsePlan = None
+  has_empty_sentinel: bool = False
+
+
+
+def make_empty_sentinel(cls: type, values: dict):
+  """Returns cls(**values) made read-only, to be shared by all the parsed objects missing a cls value.
+  The sentinel keeps the repr, fields and asdict output of a cls instance, compares equal to an equal cls instance,
+  and is unpickled as the sentinel of the unpickling process."""
+
+  def __setattr__(self, name, value):
+    raise FrozenInstanceError(f"cannot assign to field {name!r} of the shared empty {cls.__name__}")
+
+  def __delattr__(self, name):
+    raise FrozenInstanceError(f"cannot delete field {name!r} of the shared empty {cls.__name__}")
+
+  def __eq__(self, other):
+    if isinstance(other, cls):
+      return all(getattr(self, field.name) == getattr(other, field.name) for field in fields(cls) if field.compare)
+    return NotImplemented
+
+  def __reduce__(self):
+    return (cls.empty, ())
+
+  sentinel_class = type(cls.__name__, (cls,), {
+    "__slots__": (),
+    "__module__": cls.__module__,
+    "__qualname__": cls.__qualname__,
+    "__setattr__": __setattr__,
+    "__delattr__": __delattr__,
+    "__eq__": __eq__,
+    "__reduce__": __reduce__,
+  })
+
+  sentinel = cls(**values)
+  sentinel.__class__ = sentinel_class
+
+  return sentinel
+
+
+def reduce_parsed(obj) -> tuple:
+  """Pickles a parsed segment or segment group as a call of its class with its init fields values,
+  which unpickles about twice as fast as the state of a slots dataclass (pickled results of workers, parse cache)."""
+
+  cls = type(obj)
+  names = cls.__dict__.get("_init_fields_names")
+
+  if names is None:
+    names = tuple(field.name for field in fields(cls) if field.init)
+    cls._init_fields_names = names
+
+  return (cls, tuple([getattr(obj, name) for name in names]))
+
+
+
+class LazyField:
+  """Data descriptor of a field of a lazy segment group: parses the field on first access and stores it in the field slot
+  of the segment group class, so later accesses read the slot."""
+
+  __slots__ = ("slot", "field_plan")
+
+  def __init__(self, slot, field_plan: FieldParsePlan):
+    self.slot = slot
+    self.field_plan = field_plan
+
+  def __get__(self, obj, objtype=None):
+    if obj is None:
+      return self
+
+    try:
+      return self.slot.__get__(obj, objtype)
+    except AttributeError:
+      value = obj.parse_lazy_field(self.field_plan)
+      self.slot.__set__(obj, value)
+      return value
+
+  def __set__(self, obj, value):
+    self.slot.__set__(obj, value)
+
+  def __delete__(self, obj):
+    self.slot.__delete__(obj)
+
+
+
+def make_lazy_segment_group_class(cls: type) -> type:
+  """Returns a subclass of the segment group class cls whose instances keep their segments string and parse each field
+  on first access (see LazyField). Nested segment groups are lazy too.
+  Lazy segment groups keep the repr and fields of a cls instance, compare equal to an equal cls instance,
+  and are pickled or copied as cls instances (all their fields parsed)."""
+
+  plan = cls.get_parse_plan()
+  plan_fields_names = {field_plan.name for field_plan in plan.fields}
+  other_fields = [field for field in fields(cls) if field.name not in plan_fields_names]
+
+  def create(lazy_class, segment_string: parsing_utils.RawText, grouped_segments: dict):
+    segment_group = object.__new__(lazy_class)
+    segment_group._segment_string = segment_string
+    segment_group._grouped_segments = grouped_segments
+
+    for field in other_fields:
+      setattr(segment_group, field.name, field.default if field.default_factory is MISSING else field.default_factory())
+
+    return segment_group
+
+  def parse_lazy_field(self, field_plan: FieldParsePlan):
+    if field_plan.kind == EDI_STRING:
+      return self._segment_string
+
+    if self._grouped_segments is None:
+      self._grouped_segments = cls.group_segments(parsing_utils.split_segments(self._segment_string.text))
+
+    value = cls.parse_field(field_plan, self._grouped_segments.get(field_plan.name, []), lazy=True)
+
+    if value is MISSING:
+      raise ValueError(f"{cls.__name__}.{field_plan.name} segment group cannot be parsed, see the logged error")
+
+    return value
+
+  def __eq__(self, other):
+    if isinstance(other, cls):
+      return all(getattr(self, field.name) == getattr(other, field.name) for field in fields(cls) if field.compare)
+    return NotImplemented
+
+  def __reduce__(self):
+    return (cls, tuple(getattr(self, field.name) for field in fields(cls) if field.init))
+
+  namespace = {
+    "__slots__": ("_segment_string", "_grouped_segments"),
+    "__module__": cls.__module__,
+    "__qualname__": cls.__qualname__,
+    "create": classmethod(create),
+    "parse_lazy_field": parse_lazy_field,
+    "__eq__": __eq__,
+    "__hash__": None,
+    "__reduce__": __reduce__,
+  }
+
+  for field_plan in plan.fields:
+    slot = next(klass.__dict__[field_plan.name] for klass in cls.__mro__ if field_plan.name in klass.__dict__)
+    namespace[field_plan.name] = LazyField(slot, field_plan)
+
+  return type(cls.__name__, (cls,), namespace)
+
+
+
+@dataclass(slots=True)
 class SegmentParser:
 
+  __reduce__ = reduce_parsed
+
+
   @classmethod
   def get_field(cls, field_name: str):
     for field in fields(cls):
@@ -20,69 +219,121 @@ class SegmentParser:
 
 
   @classmethod
-  def from_elements(cls, elements: list):
+  def get_parse_plan(cls) -> SegmentParsePlan:
+    """Returns the parse plan of the class: its initializable fields in element order with their nested parsers.
+    Built once per class, on first use (dataclass fields only exist once the @dataclass decorator has run)."""
+
+    plan = cls.__dict__.get("_parse_plan")
+
+    if plan is None:
+      initializable_fields = [field for field in fields(cls) if field.init]
+
+      plan = SegmentParsePlan(
+        elements=tuple(
+          ElementParsePlan(
+            name=field.name,
+            parser=field.type if is_dataclass(field.type) else None,
+            decoder=parsing_utils.get_field_decoder(field),
+            default_to_empty_sentinel=is_dataclass(field.type) and field.default_factory is field.type,
+          )
+          for field in initializable_fields
+        ),
+        required_fields_names=tuple(
+          field.name for field in initializable_fields
+          if field.default is MISSING and field.default_factory is MISSING
+        ),
+      )
+      cls._parse_plan = plan
+
+    return plan
+
+
+  @classmethod
+  def empty(cls):
+    """Returns the shared read-only instance of the class with its default values (and empty sentinels as composites),
+    used for the segments and composite elements missing from the parsed segments."""
+
+    sentinel = cls.__dict__.get("_empty")
 
-    initializable_fields = [field for field in fields(cls) if field.init]
+    if sentinel is None:
+      sentinel = make_empty_sentinel(cls, {
+        element_plan.name: element_plan.parser.empty()
+        for element_plan in cls.get_parse_plan().elements
+        if element_plan.default_to_empty_sentinel
+      })
+      cls._empty = sentinel
 
-    required_initializable_fields = [field for field in initializable_fields if field.default is field.default_factory]
+    return sentinel
 
-    required_initializable_fields_names = [field.name for field in required_initializable_fields]
+
+  @classmethod
+  def from_elements(cls, elements: list, projection: dict = None):
+    """Parses the elements into the fields at the same positions. With a projection (see build_projection),
+    the composite elements it does not hold are not parsed and get their empty sentinel."""
 
     if len(elements) == 0:
-      return cls()
+      return cls.empty()
 
-    if len(required_initializable_fields) <= len(elements):
+    plan = cls.get_parse_plan()
+
+    if len(plan.required_fields_names) <= len(elements):
 
       parsed_elements = {}
 
-      for element, field in zip(elements, initializable_fields):
+      for element, element_plan in zip(elements, plan.elements):
 
-        if is_dataclass(field.type):
-          if isinstance(element, list):
-            subelements = field.type.from_elements(element)
-            parsed_elements[field.name] = subelements
+        if element_plan.parser is not None:
+          if projection is not None and element_plan.name not in projection:
+            parsed_elements[element_plan.name] = element_plan.parser.empty()
           else:
-            parsed_elements[field.name] = field.type.from_elements([element])
+            parsed_elements[element_plan.name] = element_plan.parser.from_elements(
+              element if isinstance(element, list) else [element],
+              None if projection is None else projection[element_plan.name],
+            )
+        elif element_plan.decoder is not None and isinstance(element, str):
+          parsed_elements[element_plan.name] = element_plan.decoder(element)
         else:
-          parsed_elements[field.name] = element
+          parsed_elements[element_plan.name] = element
 
-      # print(cls.__name__, parsed_elements)
+      for element_plan in plan.elements[len(elements):]:
+        if element_plan.default_to_empty_sentinel:
+          parsed_elements[element_plan.name] = element_plan.parser.empty()
 
       return cls(**parsed_elements)
     else:      
       raise ValueError(f"""Number elements to unpack into instance does not match with number of required attribute. {elements=}
       You can't have less elements than required attributes.
-      {cls.__name__} contains {len(required_initializable_fields)} required initializable attributes
-      {required_initializable_fields_names},
+      {cls.__name__} contains {len(plan.required_fields_names)} required initializable attributes
+      {list(plan.required_fields_names)},
       but initalization got {len(elements)} elements
       {elements}""")
     
     
   @classmethod
-  def from_segment_string(cls, segment_string: str):
-
-    segments = RawSegmentCollection.from_str(segment_string).segments
+  def from_segment_string(cls, segment_string: str, projection: dict = None):
 
-    elements = [segment.elements for segment in segments]
+    elements = parsing_utils.get_segments_elements(segment_string)
 
     if len(elements) == 0:
-      return cls()
+      return cls.empty()
 
     try:
       if len(elements) == 1:
-        return cls.from_elements(elements[0])
+        return cls.from_elements(elements[0], projection)
       
       else:
-        return cls.from_elements(elements)   
+        return cls.from_elements(elements, projection)   
     except Exception as e:
-      print(f"Cannot parse {cls} for elements {elements} {e}")
-      traceback.print_exc()
+      logger.exception("Cannot parse %s for elements %s %s", cls, elements, e)
   
 
 
-@dataclass
+@dataclass(slots=True)
 class SegmentGroupParser:
 
+  __reduce__ = reduce_parsed
+
+
   @classmethod
   def as_dict(self, dataclass_list: list):
     return python_utils.as_dict(dataclass_list)
@@ -93,162 +344,546 @@ class SegmentGroupParser:
     for field in fields(cls):
       if field.name == field_name:
         return field
-          
+
 
   @classmethod
-  def from_segment_string(cls, segment_string: str = None):
+  def build_projection(cls, paths: Iterable[str]) -> dict:
+    """Returns the projection of dotted fields paths such as 'EQD_CN.EQD.equipment_identification.equipment_identifier':
+    the tree of the names of the fields to parse, a name mapped to None being parsed whole. The parts of a path after a
+    field that is not a segment or segment group (e.g. edi_string.start) are ignored.
+    Raises ValueError for a path not matching the fields of the class."""
 
-    if segment_string:
-      collected_fields = {}
+    projection = {}
 
-      print(f"######### Parsing Segment Group : {cls.__name__} ########")
-      print(f"SEGMENTS_STRING = BEGIN_SEGMENT<< {segment_string} >>END_SEGMENT", end="\n\n")
-      
-      initializable_fields = [field for field in fields(cls) if field.init]
+    for path in paths:
+      node, node_class = projection, cls
+      names = path.split(".")
 
-      for field in fields(cls):
+      for depth, name in enumerate(names):
+        field = node_class.get_field(name)
 
-        print(f"######### Parsing subfield : {field.name} ########")
+        if field is None:
+          raise ValueError(f"Projection path {path!r} does not match the fields of {cls.__name__}: {node_class.__name__} has no field {name!r}")
 
-        subtype = python_utils.get_subtype(field.type)
+        field_class = field.type if is_dataclass(field.type) else python_utils.get_subtype(field.type)
+
+        if depth == len(names) - 1 or not is_dataclass(field_class):
+          node[name] = None
+          break
+
+        if name in node and node[name] is None:
+          break
 
-        # print(f"FIELD REGEX = {field_regex}")
-        print(f"FIELD TYPE = {field.type}")
-        print(f"FIELD SUBTYPE = {subtype}")
+        node = node.setdefault(name, {})
+        node_class = field_class
 
-        field_is_segment = is_dataclass(field.type) and issubclass(field.type, SegmentParser)
-        field_is_segment_group = is_dataclass(field.type) and issubclass(field.type, SegmentGroupParser)
+    return projection
 
-        subtype_is_segment = subtype and issubclass(subtype, SegmentParser)
-        subtype_is_segment_group = subtype and issubclass(subtype, SegmentGroupParser)
 
-        print(f"FIELD IS SEGMENT = {field_is_segment}")
-        print(f"FIELD IS SEGMENT GROUP = {field_is_segment_group}")
+  @classmethod
+  def get_parse_plan(cls) -> SegmentGroupParsePlan:
+    """Returns the parse plan of the class: the kind, parser and default of each field, the main segment field
+    and the segments routes, mapping each segment tag to the (field plan, compiled field regex) pairs it can be routed to.
+    Segment group fields are routed by the main segment opening the group, matched with the tag, qualifier
+    and subqualifier of the segment group field.
+    Missing segments, and missing segment groups having no list field, default to the shared empty sentinel of their class.
+    Built once per class, on first use (dataclass fields only exist once the @dataclass decorator has run)."""
+
+    plan = cls.__dict__.get("_parse_plan")
 
-        print(f"FIELD SUBTYPE IS SEGMENT = {subtype_is_segment}")
-        print(f"FIELD SUBTYPE IS SEGMENT GROUP = {subtype_is_segment_group}")
-        # print(f"FIELD ELEMENTS FOUND = {elements_collection}")
-        # print(f"FIELD ELEMENTS SIZE = {len(elements_collection)}")
+    if plan is None:
+      field_plans = []
+      routes = {}
+      main_segment_field = None
+
+      for field in fields(cls):
+        subtype = python_utils.get_subtype(field.type)
 
         if field.name == "edi_string":
-          collected_fields[field.name] = segment_string
-
-        # Case 1 : Field is of type SegmentGroupParser
-        if field_is_segment_group:
-          field_segment_groups_strings = parsing_utils.get_segment_groups_string(field=field, segments_string=segment_string)
-          print(f"{field.name} SEGMENT GROUPS STRINGS = {field_segment_groups_strings}")
-          
-          if len(field_segment_groups_strings) == 0:
-            collected_fields[field.name] = field.default_factory()
-          elif len(field_segment_groups_strings) == 1:
-            try:
-              parsed_segment_group = field.type.from_segment_string(*field_segment_groups_strings[0])
-              print(f"PARSED SEGMENT GROUP {parsed_segment_group=}")
-              collected_fields[field.name] = parsed_segment_group
-            except Exception as e:
-              print(f"Error on segment group type parsing for {field.name=} {field.type=} {field_segment_groups_strings=} error_message={e}")
-              traceback.print_exc()
-          else:
-            collected_fields[field.name] = field.default_factory()
-            raise ValueError(f"""{field.name} is not a list type so cannot have multiple '{field.name}' matches in segment group string. 
-              Either changes this field to List[{field.type.__name__}] or verify your segment group string to match only one value.
-              Matched segment groups strings {field_segment_groups_strings}
-              Please check the type of {field.name} in {cls.__name__} and ensure this segment group only matches one value or is of type List""")
-
-
-        # Case 2 : Field is of type List[SegmentGroupParser]
-        if subtype_is_segment_group:
-          subtype_segment_groups_strings = parsing_utils.get_segment_groups_string(field=field, segments_string=segment_string)
-          print(f"{field.name} SUBTYPE SEGMENT GROUPS STRINGS = {subtype_segment_groups_strings}")
-          
-          parsed_segment_groups = []
-          
-          if len(subtype_segment_groups_strings) >= 1:
-
-            for s in subtype_segment_groups_strings:
-
-              if len(s) >= 1:
-                  try:
-                    parsed_segment_group = subtype.from_segment_string(*s)
-                    parsed_segment_groups.append(parsed_segment_group)
-                  except Exception as e:
-                    print(f"Error on segment group subtype parsing for {field.name=} {field.type=} {field_segment_strings=} error_message={e}")
-                    traceback.print_exc()
-
-
-          print(f"PARSED SEGMENT GROUPS {parsed_segment_groups=}")
-          collected_fields[field.name] = parsed_segment_groups
-
-
-        # Case 3 : Field is of type SegmentParser
-        if field_is_segment:
-          field_segment_strings = parsing_utils.get_segment_strings(field=field, segments_string=segment_string)
-          print(f"{field.name} SEGMENT STRINGS = {field_segment_strings}")
-          if len(field_segment_strings) == 0:
-            collected_fields[field.name] = field.default_factory()
-          elif len(field_segment_strings) == 1:
-            try:
-              parsed_segment = field.type.from_segment_string(*field_segment_strings)
-              print(f"PARSED SEGMENT {parsed_segment=}")
-              collected_fields[field.name] = parsed_segment
-            except Exception as e:
-              collected_fields[field.name] = field.default_factory()
-              print(f"Error on segment type parsing for {field.name=} {field.type=} {field_segment_strings=} error_message={e}")
-              traceback.print_exc()
+          kind, parser = EDI_STRING, None
+        elif is_dataclass(field.type) and issubclass(field.type, SegmentParser):
+          kind, parser = SEGMENT, field.type
+        elif is_dataclass(field.type) and issubclass(field.type, SegmentGroupParser):
+          kind, parser = SEGMENT_GROUP, field.type
+        elif subtype and issubclass(subtype, SegmentParser):
+          kind, parser = SEGMENTS_LIST, subtype
+        elif subtype and issubclass(subtype, SegmentGroupParser):
+          kind, parser = SEGMENT_GROUPS_LIST, subtype
+        else:
+          continue
 
-          else:
-            raise ValueError(f"""{field.name} is not a list type so cannot have multiple '{field.name}' matches in segment string. 
-              Either changes this field to List[{field.type.__name__}] or verify your segment string to match only one value.
-              Matched segments string {field_segment_strings}
-              Please check the type of {field.name} in {cls.__name__} and ensure this segment only matches one value or is of type List""")
-
-
-        # Case 4 : Field is of type List[SegmentParser]
-        if subtype_is_segment:
-          subtype_segment_strings = parsing_utils.get_segment_strings(field=field, segments_string=segment_string)
-          print(f"{field.name} SUBTYPE SEGMENT STRINGS = {subtype_segment_strings}")
-          
-          parsed_segments = []
-
-          if len(subtype_segment_strings) >= 1:
-            for s in subtype_segment_strings:
-              try:
-                parsed_segment = subtype.from_segment_string(s)
-                parsed_segments.append(parsed_segment)
-              except Exception as e:
-                print(f"Error on segment subtype parsing for {field.name=} {field.type=} {subtype_segment_strings=} error_message={e}")
-                traceback.print_exc()
-
-          print(f"PARSED SEGMENTS {parsed_segments=}")
-          collected_fields[field.name] = parsed_segments
-        
-      return cls(**collected_fields)
+        if kind in (SEGMENT_GROUP, SEGMENT_GROUPS_LIST) and parser.get_parse_plan().main_segment_field is None:
+          raise ValueError(f"""{parser.__name__} has no field with 'is_main_segment' metadata, so {cls.__name__}.{field.name} groups cannot be opened.""")
+
+        default_factory = field.default_factory
+
+        if default_factory is parser and (kind == SEGMENT or (kind == SEGMENT_GROUP and parser.get_parse_plan().has_empty_sentinel)):
+          default_factory = parser.empty
+
+        field_plan = FieldParsePlan(
+          name=field.name,
+          kind=kind,
+          parser=parser,
+          default_factory=default_factory,
+          is_main_segment=field.metadata.get("is_main_segment", False),
+        )
+        field_plans.append(field_plan)
+
+        if field_plan.is_main_segment:
+          main_segment_field = field_plan
+
+        if kind != EDI_STRING:
+          routes.setdefault(field.name[:3], []).append((field_plan, parsing_utils.compile_field_regex(field)))
+
+      plan = SegmentGroupParsePlan(
+        fields=tuple(field_plans),
+        routes=MappingProxyType({tag: tuple(tag_routes) for tag, tag_routes in routes.items()}),
+        main_segment_field=main_segment_field,
+        has_empty_sentinel=len(field_plans) == len(fields(cls)) and all(
+          field_plan.kind == EDI_STRING or field_plan.default_factory == field_plan.parser.empty
+          for field_plan in field_plans
+        ),
+      )
+      cls._parse_plan = plan
+
+    return plan
+
+
+  @classmethod
+  def empty(cls):
+    """Returns the shared read-only instance of the class with empty sentinels as segments and segment groups.
+    Only segment groups without list fields have one, see has_empty_sentinel."""
+
+    sentinel = cls.__dict__.get("_empty")
+
+    if sentinel is None:
+      plan = cls.get_parse_plan()
+
+      if not plan.has_empty_sentinel:
+        raise TypeError(f"{cls.__name__} has list or required fields, so it has no shared empty instance")
+
+      sentinel = make_empty_sentinel(cls, {
+        field_plan.name: field_plan.parser.empty()
+        for field_plan in plan.fields
+        if field_plan.kind != EDI_STRING
+      })
+      cls._empty = sentinel
+
+    return sentinel
+
+
+  @classmethod
+  def route_segment(cls, segment: str) -> FieldParsePlan:
+    """Returns the plan of the first field whose regex matches the segment, or None."""
+
+    for field_plan, field_regex in cls.get_parse_plan().routes.get(segment[:3], ()):
+      if field_regex.match(segment):
+        return field_plan
+
+    return None
+
+
+  @classmethod
+  def group_segments(cls, segments: list) -> dict:
+    """Assigns every segment to its (nested) segment group in one linear pass.
+
+    The groups being filled are kept in a stack. Each segment is routed to the innermost group having a field
+    for it, which closes all the groups nested under that one. A segment routed to a segment group field opens a new
+    group, as does a main segment found in an already opened nested group (it then closes that group and opens a sibling).
+    Segments that no group of the stack can hold are ignored.
+
+    Returns the segments strings by field name, segment group fields holding one such dictionary per group."""
+
+    grouped_segments = {}
+    stack = [(cls, grouped_segments)]
+
+    for segment in segments:
+      for depth in range(len(stack) - 1, -1, -1):
+        segment_group_type, group = stack[depth]
+        field_plan = segment_group_type.route_segment(segment)
+
+        if field_plan is None:
+          continue
+
+        if depth > 0 and field_plan.is_main_segment:
+          continue
+
+        del stack[depth + 1:]
+
+        if field_plan.kind in (SEGMENT, SEGMENTS_LIST):
+          group.setdefault(field_plan.name, []).append(segment)
+        else:
+          nested_group = {field_plan.parser.get_parse_plan().main_segment_field.name: [segment]}
+          group.setdefault(field_plan.name, []).append(nested_group)
+          stack.append((field_plan.parser, nested_group))
+
+        break
+
+    return grouped_segments
+
+
+  @classmethod
+  def from_segment_string(cls, segment_string: Union[str, parsing_utils.RawText] = None, projection: dict = None):
+    """Parses a segments group string. Its edi_string field (if any) gets segment_string as a RawText reference,
+    so a RawText read from a whole EDI text is kept as a reference into that text instead of a copy.
+    With a projection (see build_projection), only the fields it holds are parsed, see from_grouped_segments."""
+
+    if segment_string:
+      raw_text = segment_string if isinstance(segment_string, parsing_utils.RawText) else parsing_utils.RawText(segment_string)
+      segment_string = raw_text.text
+
+      if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("######### Parsing Segment Group : %s ########", cls.__name__)
+        logger.debug("SEGMENTS_STRING = BEGIN_SEGMENT<< %s >>END_SEGMENT", segment_string)
+
+      grouped_segments = cls.group_segments(parsing_utils.split_segments(segment_string))
+
+      return cls.from_grouped_segments(grouped_segments, edi_string=raw_text, projection=projection)
     
     else:
       return cls()
 
 
-    
+  @classmethod
+  def from_grouped_segments(cls, grouped_segments: dict, edi_string: parsing_utils.RawText = parsing_utils.EMPTY_RAW_TEXT, projection: dict = None):
+    """Parses the segments grouped by group_segments. With a projection (see build_projection), the fields it does not hold
+    are not parsed and get their default value (an empty list for list fields), fields without default (e.g. main segments)
+    are parsed whole. Their segments are still grouped, and a non list field matching several segments still fails
+    the segment group as without projection.
+
+    Missing segments, composite elements and segment groups without list fields are the shared empty sentinel of their class
+    (see make_empty_sentinel), not fresh instances: they are read-only, assigning to their fields raises FrozenInstanceError.
+    To change such a value, assign a new instance to the field of the parsed segment group instead."""
+
+    collected_fields = {}
+
+    for field_plan in cls.get_parse_plan().fields:
+      name = field_plan.name
+
+      if field_plan.kind == EDI_STRING:
+        collected_fields[name] = edi_string if projection is None or name in projection else parsing_utils.EMPTY_RAW_TEXT
+        continue
+
+      value = cls.parse_field(field_plan, grouped_segments.get(name, []), projection)
+
+      if value is not MISSING:
+        collected_fields[name] = value
+
+    return cls(**collected_fields)
+
 
   @classmethod
-  def parse_segments_groups(self, segments_groups:list):
-    
-    @python_utils.progress(segments_groups)
-    def parse_segment_group(segment_group: str, cls):
-      # try:
-        segment_group = self.from_segment_string(segment_group)
-        return segment_group
-      # except Exception as e:
-        # first_segment = segment_group.split("'")[0]
-        # print(f"Error when parsing segment_group {cls} {first_segment}..., Error Message = {e}")
-
-    segment_groups = []
-
-    for s in segments_groups:
-      
-      segment_group = parse_segment_group(s, self)
+  def parse_field(cls, field_plan: FieldParsePlan, values: list, projection: dict = None, lazy: bool = False):
+    """Parses the grouped segments of one field (see from_grouped_segments), nested segment groups being lazy if lazy is set.
+    Returns MISSING if the segment group of a non list field failed to parse (the error is logged)."""
+
+    name, kind, parser = field_plan.name, field_plan.kind, field_plan.parser
+    projected = projection is None or name in projection or field_plan.default_factory is MISSING
+    field_projection = None if projection is None else projection.get(name)
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    if debug:
+      logger.debug("######### Parsing subfield : %s ######## VALUES = %s", name, values)
+
+    if not projected and kind in (SEGMENTS_LIST, SEGMENT_GROUPS_LIST):
+      return []
+
+    # Case 1 : Field is of type SegmentGroupParser
+    if kind == SEGMENT_GROUP:
+      if len(values) == 0 or (len(values) == 1 and not projected):
+        return field_plan.default_factory()
+      elif len(values) == 1:
+        if lazy:
+          return parser.lazy_from_grouped_segments(values[0])
+        try:
+          parsed_segment_group = parser.from_grouped_segments(values[0], projection=field_projection)
+          if debug:
+            logger.debug("PARSED SEGMENT GROUP parsed_segment_group=%r", parsed_segment_group)
+          return parsed_segment_group
+        except Exception as e:
+          logger.exception("Error on segment group type parsing for name=%r parser=%r values=%r error_message=%s", name, parser, values, e)
+          return MISSING
+      else:
+        raise ValueError(f"""{name} is not a list type so cannot have multiple '{name}' matches in segment group string. 
+          Either changes this field to List[{parser.__name__}] or verify your segment group string to match only one value.
+          Matched segment groups {values}
+          Please check the type of {name} in {cls.__name__} and ensure this segment group only matches one value or is of type List""")
+
+
+    # Case 2 : Field is of type List[SegmentGroupParser]
+    elif kind == SEGMENT_GROUPS_LIST:
+      if lazy:
+        return [parser.lazy_from_grouped_segments(g) for g in values]
+
+      parsed_segment_groups = []
+
+      for g in values:
+        try:
+          parsed_segment_group = parser.from_grouped_segments(g, projection=field_projection)
+          parsed_segment_groups.append(parsed_segment_group)
+        except Exception as e:
+          logger.exception("Error on segment group subtype parsing for name=%r parser=%r g=%r error_message=%s", name, parser, g, e)
+
+      if debug:
+        logger.debug("PARSED SEGMENT GROUPS parsed_segment_groups=%r", parsed_segment_groups)
+      return parsed_segment_groups
+
+
+    # Case 3 : Field is of type SegmentParser
+    elif kind == SEGMENT:
+      if len(values) == 0 or (len(values) == 1 and not projected):
+        return field_plan.default_factory()
+      elif len(values) == 1:
+        try:
+          parsed_segment = parser.from_segment_string(values[0], field_projection)
+          if debug:
+            logger.debug("PARSED SEGMENT parsed_segment=%r", parsed_segment)
+          return parsed_segment
+        except Exception as e:
+          logger.exception("Error on segment type parsing for name=%r parser=%r values=%r error_message=%s", name, parser, values, e)
+          return field_plan.default_factory()
+
+      else:
+        raise ValueError(f"""{name} is not a list type so cannot have multiple '{name}' matches in segment string. 
+          Either changes this field to List[{parser.__name__}] or verify your segment string to match only one value.
+          Matched segments string {values}
+          Please check the type of {name} in {cls.__name__} and ensure this segment only matches one value or is of type List""")
+
+
+    # Case 4 : Field is of type List[SegmentParser]
+    elif kind == SEGMENTS_LIST:
+      parsed_segments = []
+
+      for s in values:
+        try:
+          parsed_segment = parser.from_segment_string(s, field_projection)
+          parsed_segments.append(parsed_segment)
+        except Exception as e:
+          logger.exception("Error on segment subtype parsing for name=%r parser=%r values=%r error_message=%s", name, parser, values, e)
+
+      if debug:
+        logger.debug("PARSED SEGMENTS parsed_segments=%r", parsed_segments)
+      return parsed_segments
+
+
+  @classmethod
+  def lazy_class(cls) -> type:
+    """Returns the lazy subclass of the class, see make_lazy_segment_group_class. Built once per class, on first use."""
+
+    lazy_class = cls.__dict__.get("_lazy_class")
+
+    if lazy_class is None:
+      lazy_class = make_lazy_segment_group_class(cls)
+      cls._lazy_class = lazy_class
+
+    return lazy_class
+
+
+  @classmethod
+  def lazy_from_segment_string(cls, segment_string: Union[str, parsing_utils.RawText] = None):
+    """Returns a lazy segment group keeping segment_string: its segments are grouped on the first field access,
+    and each field is parsed (and cached) the first time it is accessed. Parsing errors are raised on access."""
+
+    if not segment_string:
+      return cls()
+
+    raw_text = segment_string if isinstance(segment_string, parsing_utils.RawText) else parsing_utils.RawText(segment_string)
+
+    return cls.lazy_class().create(raw_text, None)
+
+
+  @classmethod
+  def lazy_from_grouped_segments(cls, grouped_segments: dict):
+    """Returns a lazy segment group parsing its fields from grouped_segments on access, see lazy_from_segment_string."""
+
+    return cls.lazy_class().create(parsing_utils.EMPTY_RAW_TEXT, grouped_segments)
+
+
+
+  @classmethod
+  def iter_parse_segments_groups(cls, segments_groups: Iterable[str], workers: int = 1, chunk_size: int = DEFAULT_PARSE_CHUNK_SIZE, metrics: metrics_utils.ParseMetrics = None, projection: dict = None, lazy: bool = False, revision=None):
+    """Parses the segments groups strings and yields the parsed segment groups in input order.
+
+    With more than one worker, chunks of chunk_size segments groups are parsed in a process pool. At most
+    2 chunks per worker are submitted ahead of the one being yielded, so segments_groups can be a generator
+    and memory stays bounded. A segment group that fails to parse is reported and skipped, the others are still parsed.
+    Each segment group is recorded in metrics if given, with the time its parse took (in the worker that parsed it).
+    With a projection (see build_projection), only the fields it holds are parsed.
+    With lazy, lazy segment groups are yielded (see lazy_from_segment_string): nothing is parsed here, so workers are not used.
+    With a revision (utils.revision_utils.RevisionTracker), the segments groups unchanged since the previous revision are reused
+    instead of parsed, the others are parsed in this process."""
+
+    if lazy and (projection is not None or revision is not None):
+      raise ValueError("Lazy segment groups only parse the fields accessed, they cannot be given a projection or a revision")
+
+    if revision is not None:
+      for index, segment_group in enumerate(segments_groups):
+        group_hash, parsed_segment_group = revision.lookup(segment_group)
+
+        if parsed_segment_group is not None:
+          attach_edi_strings(parsed_segment_group, segment_group, projection)
+          results = report_parsed_segment_group(cls, index, segment_group, parsed_segment_group, None, 0.0, metrics)
+        else:
+          results = report_parsed_segment_group(cls, index, segment_group, *parse_segment_group_safely(cls, segment_group, projection), metrics)
+
+        for parsed_segment_group in results:
+          revision.add(group_hash, parsed_segment_group)
+          yield parsed_segment_group
+      return
+
+    if workers <= 1 or lazy:
+      for index, segment_group in enumerate(segments_groups):
+        yield from report_parsed_segment_group(cls, index, segment_group, *parse_segment_group_safely(cls, segment_group, projection, lazy), metrics)
+      return
+
+    segments_groups = iter(segments_groups)
+    chunks = ((start_index, list(islice(segments_groups, chunk_size))) for start_index in count(0, chunk_size))
+
+    for chunk_start_index, chunk, chunk_results in iter_parse_chunks(cls, takewhile(lambda chunk: chunk[1], chunks), workers, projection):
+      for index, segment_group, chunk_result in zip(count(chunk_start_index), chunk, chunk_results):
+        attach_edi_strings(chunk_result[0], segment_group, projection)
+        yield from report_parsed_segment_group(cls, index, segment_group, *chunk_result, metrics)
+
+
+  @classmethod
+  def iter_parse_messages(cls, messages: Iterable[parsing_utils.EdiMessage], segments_pattern: str, workers: int = 1, chunk_size: int = DEFAULT_PARSE_CHUNK_SIZE, metrics: metrics_utils.ParseMetrics = None, projection: dict = None):
+    """Parses the segments groups matching segments_pattern of each message of an interchange (see parsing_utils.read_edi_messages)
+    independently, and yields (message, list of its parsed segment groups) in message order.
+
+    With more than one worker, messages are parsed in parallel: each message is sent to the process pool as chunks of at most
+    chunk_size of its segments groups. Failed segment groups are reported and skipped as in iter_parse_segments_groups."""
+
+    def iter_messages_chunks():
+      for message in messages:
+        segments_groups = message.read_segments_groups(segments_pattern)
+        # Messages without segments groups are sent as an empty chunk, so that they are yielded too
+        for start_index in range(0, max(len(segments_groups), 1), chunk_size):
+          yield (message, start_index), segments_groups[start_index:start_index + chunk_size]
+
+    current_message, parsed_segments_groups = None, []
+
+    for (message, chunk_start_index), chunk, chunk_results in iter_parse_chunks(cls, iter_messages_chunks(), workers, projection):
+      if message is not current_message:
+        if current_message is not None:
+          yield current_message, parsed_segments_groups
+        current_message, parsed_segments_groups = message, []
+
+      for index, segment_group, chunk_result in zip(count(chunk_start_index), chunk, chunk_results):
+        attach_edi_strings(chunk_result[0], segment_group, projection)
+        parsed_segments_groups.extend(report_parsed_segment_group(cls, index, segment_group, *chunk_result, metrics))
+
+    if current_message is not None:
+      yield current_message, parsed_segments_groups
+
+
+  @classmethod
+  def parse_segments_groups(self, segments_groups: Iterable[str], workers: int = 1, chunk_size: int = DEFAULT_PARSE_CHUNK_SIZE, metrics: metrics_utils.ParseMetrics = None, projection: dict = None, lazy: bool = False, revision=None):
+    """Parses the segments groups strings into a list of segment groups, in input order. See iter_parse_segments_groups.
+    Without metrics, the progress is shown as a bar on stderr."""
+
+    if metrics is None:
+      metrics = metrics_utils.ParseMetrics(total_groups=len(segments_groups) if hasattr(segments_groups, "__len__") else None)
+
+    with metrics:
+      return list(self.iter_parse_segments_groups(segments_groups, workers, chunk_size, metrics, projection, lazy, revision))
+
+
+
+def iter_parse_chunks(segment_group_class: type, chunks: Iterable[tuple], workers: int = 1, projection: dict = None):
+  """Parses chunks of segments groups given as (tag, chunk) and yields (tag, chunk, parse_segment_group_safely results of the chunk)
+  in input order. With more than one worker, chunks are parsed in a process pool, at most 2 chunks per worker being submitted
+  ahead of the one being yielded, and the edi_string fields of the results are empty (see parse_segments_groups_chunk)."""
+
+  if workers <= 1:
+    for tag, chunk in chunks:
+      yield tag, chunk, [parse_segment_group_safely(segment_group_class, segment_group, projection) for segment_group in chunk]
+    return
+
+  chunks = iter(chunks)
+  pending_chunks = deque()
+
+  with ProcessPoolExecutor(
+    max_workers=workers,
+    initializer=initialize_parsing_worker,
+    initargs=(parsing_utils.element_splitter, logging_utils.logging_configuration),
+  ) as executor:
+
+    while True:
+      for tag, chunk in islice(chunks, 2 * workers - len(pending_chunks)):
+        pending_chunks.append((tag, chunk, executor.submit(parse_segments_groups_chunk, segment_group_class, chunk, projection)))
+
+      if not pending_chunks:
+        break
+
+      tag, chunk, future = pending_chunks.popleft()
+
+      try:
+        chunk_results = future.result()
+      except Exception:
+        # The whole chunk was lost (e.g. a worker died), each of its segments groups is reported as failed
+        error = traceback.format_exc()
+        chunk_results = [(None, error, 0.0)] * len(chunk)
+
+      yield tag, chunk, chunk_results
+
+
+def initialize_parsing_worker(element_splitter: str, logging_configuration: tuple = None):
+  """Process pool initializer: applies the element splitter and logging configuration of the parent process."""
+  parsing_utils.set_element_splitter(element_splitter)
+
+  if logging_configuration is not None:
+    logging_utils.configure_logging(*logging_configuration)
+
+
+def parse_segment_group_safely(segment_group_class: type, segment_group: str, projection: dict = None, lazy: bool = False):
+  """Returns (parsed segment group, None, parse time), or (None, formatted traceback, parse time) if parsing failed.
+  With lazy, the segment group is lazy (see SegmentGroupParser.lazy_from_segment_string)."""
+  start_time = time.perf_counter()
+  try:
+    if lazy:
+      return segment_group_class.lazy_from_segment_string(segment_group), None, time.perf_counter() - start_time
+    return segment_group_class.from_segment_string(segment_group, projection), None, time.perf_counter() - start_time
+  except Exception:
+    return None, traceback.format_exc(), time.perf_counter() - start_time
+
+
+def parse_segments_groups_chunk(segment_group_class: type, segments_groups: list, projection: dict = None) -> list:
+  """Process pool task: parses a chunk of segments groups, returns one parse_segment_group_safely result per segment group.
+  The edi_string fields are emptied, not to send the segments groups texts back: the parent process attaches its own references."""
+
+  chunk_results = [parse_segment_group_safely(segment_group_class, segment_group, projection) for segment_group in segments_groups]
+
+  for parsed_segment_group, _, _ in chunk_results:
+    attach_edi_strings(parsed_segment_group, parsing_utils.EMPTY_RAW_TEXT)
+
+  return chunk_results
+
+
+def attach_edi_strings(parsed_segment_group, segment_group: Union[str, parsing_utils.RawText], projection: dict = None):
+  """Sets the edi_string fields of a parsed segment group (if any, and held by the projection if given) to a reference to segment_group."""
+
+  if parsed_segment_group is None:
+    return
+
+  for field_plan in type(parsed_segment_group).get_parse_plan().fields:
+    if field_plan.kind == EDI_STRING and (projection is None or field_plan.name in projection):
+      raw_text = segment_group if isinstance(segment_group, parsing_utils.RawText) else parsing_utils.RawText(segment_group)
+      setattr(parsed_segment_group, field_plan.name, raw_text)
+
 
-      if segment_group:
-        segment_groups.append(segment_group)
+def report_parsed_segment_group(segment_group_class: type, index: int, segment_group: str, parsed_segment_group, error: str, parse_time: float, metrics: metrics_utils.ParseMetrics = None):
+  """Records the segment group in metrics, yields the parsed segment group if any, reports the error of a failed one."""
+  if metrics is not None:
+    metrics.add_group(
+      segment_group_class.__name__,
+      segments_count=segment_group.count(parsing_utils.DEFAULT_SERVICE_STRING.segment_terminator),
+      bytes_count=len(segment_group),
+      parse_time=parse_time,
+      failed=error is not None,
+    )
 
-    return segment_groups
\ No newline at end of file
+  if error is not None:
+    first_segment = str(segment_group).split("'")[0]
+    logger.error("Error when parsing segment group #%s %s %s..., error_message=%s", index, segment_group_class.__name__, first_segment, error)
+  elif parsed_segment_group:
+    yield parsed_segment_group
@@ -1,6 +1,7 @@
 from typing import List
 from dataclasses import dataclass, field
 
+from utils import parsing_utils
 from data_model.baplie_parsers import SegmentGroupParser
 
 from data_model.baplie_segments import (
@@ -23,20 +24,20 @@ from data_model.baplie_segments import (
 )
 
 
-@dataclass
+@dataclass(slots=True)
 class EquipmentAttachmentSegmentGroup(SegmentGroupParser):
     EQA: EquipmentAttachment = field(default_factory=EquipmentAttachment, metadata={"is_main_segment": True})
     NAD: NameAndAddress = field(default_factory=NameAndAddress)
 
 
-@dataclass
+@dataclass(slots=True)
 class TemperatureSegmentGroup(SegmentGroupParser):
     TMP: Temperature = field(default_factory=Temperature, metadata={"is_main_segment": True})
     RNG: Range = field(default_factory=Range)
     DTM: DateTime = field(default_factory=DateTime)
 
 
-@dataclass
+@dataclass(slots=True)
 class DangerousGoodsSegmentGroup(SegmentGroupParser):
     DGS: DangerousGoods = field(default_factory=DangerousGoods, metadata={"is_main_segment": True})
     ATT: List[Attribute] = field(default_factory=list)
@@ -51,7 +52,7 @@ class DangerousGoodsSegmentGroup(SegmentGroupParser):
     FTX_AAD: FreeText = field(default_factory=FreeText, metadata={"qualifier": "AAD"})
 
 
-@dataclass
+@dataclass(slots=True)
 class EquipmentDetailsSegmentGroup(SegmentGroupParser):
     EQD: EquipmentDetails = field(default_factory=EquipmentDetails, metadata={"is_main_segment": True})
 
@@ -94,7 +95,7 @@ class EquipmentDetailsSegmentGroup(SegmentGroupParser):
     DIM_23_CONTAINER_BODY_OFF_WIDTH: Dimensions = field(default_factory=Dimensions, metadata={"qualifier": "23"}) # Container off-standard dimension width of body
 
 
-@dataclass
+@dataclass(slots=True)
 class LocationSegmentGroup(SegmentGroupParser):
     LOC_147: Location = field(metadata={"is_main_segment": True, "qualifier": "147"})
     FTX_AGW: FreeText = field(default_factory=FreeText, metadata={"qualifier": "AGW"})
@@ -102,10 +103,10 @@ class LocationSegmentGroup(SegmentGroupParser):
     EQD_CN: List[EquipmentDetailsSegmentGroup] = field(default_factory=list, metadata={"qualifier": "CN"})
     EQD_BB: List[EquipmentDetailsSegmentGroup] = field(default_factory=list, metadata={"qualifier": "BB"})
     CNT: ControlTotal = field(default_factory=ControlTotal)
-    edi_string: str = field(default="")
+    edi_string: parsing_utils.RawText = field(default=parsing_utils.EMPTY_RAW_TEXT)
 
 
-@dataclass
+@dataclass(slots=True)
 class TankSegmentGroup(SegmentGroupParser):
   LOC_ZZZ: Location = field(default_factory=Location, metadata={"qualifier": "ZZZ"})
   MEA_WT: Measurement = field(default_factory=Measurement, metadata={"qualifier": "WT"})
@@ -1,74 +1,127 @@
 import os
+import sys
 import glob
-import traceback
+import logging
 
 import argparse
 
 from utils import parsing_utils
 from utils import python_utils
+from utils import metrics_utils
+from utils import logging_utils
+from utils import serialization_utils
+from utils import arrow_utils
+from utils import cache_utils
+from utils import revision_utils
+from utils import corpus_utils
 
 from data_model.baplie_segments import Temperature, TemperatureSetting
+from data_model import baplie_parsers
 from data_model import baplie_segments_groups
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--simulation", "-s", type=str, default='164', help="Simulation number")
 parser.add_argument("--env", "-e", type=str, default="prod", help="Environment (prod or dev)")
 parser.add_argument("--type", "-t", type=str, default="onboard", help="File type (loadlist or onboard or tank. First char or number is also possible. You can add [type]_test in order to run on a test data)", choices=["loadlist", "onboard", "tank", 0, 1, 2, "l", "o", "t"])
+parser.add_argument("--element-splitter", type=str, default="native", choices=parsing_utils.ELEMENT_SPLITTERS, help="How segments are split into elements: native splitter, pydifact, or verify (runs both and reports differences)")
+parser.add_argument("--mmap", "-m", action="store_true", help="Memory-map the .edi file and search the segments groups on its raw bytes instead of streaming it")
+parser.add_argument("--workers", "-w", type=int, default=1, help="Number of processes parsing the segments groups (1 parses them in the main process)")
+parser.add_argument("--progress", type=str, default="bar", choices=list(metrics_utils.PROGRESS_SINKS), help="How the parsing progress and throughput are reported on stderr: a progress bar, JSON lines or nothing")
+parser.add_argument("--log-level", type=str, default="INFO", choices=logging_utils.LOG_LEVELS, help="Log level of all modules")
+parser.add_argument("--log-module", type=str, action="append", default=[], help="Log level of one module, as module=LEVEL (e.g. data_model.baplie_parsers=DEBUG). Can be repeated")
+parser.add_argument("--raw-text", type=str, default="include", choices=parsing_utils.RAW_TEXT_MODES, help="How the raw EDI text of each group is written to the JSON output: the text itself, its start and end offsets in the .edi file, or nothing")
+parser.add_argument("--compact", action="store_true", help="Write the JSON output without indentation")
+parser.add_argument("--skip-defaults", action="store_true", help="Leave out of the JSON output the fields equal to their default value (e.g. missing segments)")
+parser.add_argument("--json-backend", type=str, default="json", choices=serialization_utils.JSON_BACKENDS, help="JSON library writing the output, auto uses orjson when it is installed. orjson is faster but its output differs from the json one: non-ASCII characters are written as is instead of escaped, and NaN values as null")
+parser.add_argument("--output-format", type=str, default="json", choices=["json", "ndjson", *arrow_utils.TABLES_FORMATS], help="Write a JSON array file, a JSON lines file (one segments group per line), or a directory of Parquet or Arrow IPC files with one table per level (groups, EQD_CN, EQD_CN.DGS, EQD_CN.HAN...)")
+parser.add_argument("--projection", type=str, action="append", default=[], help="Dotted path of a field to parse (e.g. EQD_CN.EQD.equipment_identification.equipment_identifier), the fields feeding no projection path are skipped. Can be repeated, all fields are parsed if none is given")
+parser.add_argument("--projection-file", type=str, default=None, help="File of projection paths, one per line (see --projection), such as the FINAL_COLUMNS keys of preprocessing_containers/runner.py")
+parser.add_argument("--cache-dir", type=str, default=None, help="Directory of the parse cache: a file already parsed with the same parser, model and options is loaded from it instead of being parsed again. No cache if not given")
+parser.add_argument("--cache-max-size", type=int, default=cache_utils.DEFAULT_CACHE_MAX_BYTES >> 20, help="Size in MB above which the least recently used parse cache entries are removed")
+parser.add_argument("--incremental", action="store_true", help="Reuse the segments groups unchanged since the previous run on this simulation and type (a previous revision of the .edi file) instead of parsing them, and write the added, removed and changed slots to a .delta.json file")
+parser.add_argument("--split-messages", action="store_true", help="Split the .edi file into its UNH...UNT messages (several BAPLIE or TANSTA messages in one interchange), checking their UNT segments counts, parse the messages in parallel and write their header metadata (sender, message reference, vessel IMO, port) to a .messages.json file")
+parser.add_argument("--strict-messages", action="store_true", help="With --split-messages, stop on a UNT or UNZ count mismatch instead of logging it")
+parser.add_argument("--corpus", type=str, nargs="?", const="", default=None, help="Parse the .edi file of every call folder (call_XX_PORT) of the simulation, or of the given service or simulation directory (e.g. ../pdata/referential/EDI_referential/CJX), the calls being parsed in parallel by --workers processes. Each call is written to its own folder of the output directory, and the tables of all calls, keyed by call index and port, to a combined {type}_calls tables directory")
+parser.add_argument("--output-dir", type=str, default=None, help="Directory of the outputs, output_data/simulation_{simulation}_{env} by default")
+parser.add_argument("--chunk-size", type=int, default=baplie_parsers.DEFAULT_PARSE_CHUNK_SIZE, help="Number of segments groups sent at once to a parsing process")
 
-args = parser.parse_args()
+logger = logging.getLogger("main")
 
-simulation = args.simulation
-env = args.env
 
-def check_if_test(args_type, input_type):
-    if "test" in str(args_type).lower():
-        return f"{input_type}_test"
-    return input_type
+def get_projection(args, segments_group_class):
+    """Returns the projection of the --projection and --projection-file paths, None if there are none."""
+    projection_paths = list(args.projection)
+    if args.projection_file:
+        with open(args.projection_file, "r") as f:
+            projection_paths += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    return segments_group_class.build_projection(projection_paths) if projection_paths else None
+
 
-if str(args.type).lower() in ("onboard", "o", 1):
-    input_type = "OnBoard"
-elif str(args.type).lower() in ("loadlist", "l", 0):
-    input_type = "LoadList"
-elif str(args.type).lower() in ("tank", "t", 2):
-    input_type = "Tank"
-else:
-    raise ValueError("Invalid processing type, only ('loadlist', 'l', 0) or ('onboard', 1, o) or ('tank', 'l', 2) are allowed !")
+def run_corpus(args, input_type, corpus_dir, output_dir):
+    """Parses the {input_type}.edi file of every call folder of corpus_dir, writes each call to output_dir/{call folder}/
+    and the tables of all calls, keyed by call index and port, to output_dir/{input_type}_calls/."""
+    segments_group_class = baplie_segments_groups.TankSegmentGroup if input_type == "Tank" else baplie_segments_groups.LocationSegmentGroup
+    output_json_name = check_if_test(args.type, input_type)
+    tables_output = args.output_format in arrow_utils.TABLES_FORMATS
+
+    calls = corpus_utils.discover_calls(corpus_dir, input_type)
+    logger.info("Found %s call folders with a %s.edi file in %s", len(calls), input_type, corpus_dir)
+
+    def get_output_path(call):
+        os.makedirs(os.path.join(output_dir, call.name), exist_ok=True)
+        return os.path.join(output_dir, call.name, output_json_name if tables_output else f"{output_json_name}.{args.output_format}")
 
+    calls_summaries = corpus_utils.parse_calls(
+        calls,
+        get_output_path,
+        workers=args.workers,
+        segments_group_class=segments_group_class,
+        segments_pattern=parsing_utils.TANK_SEGMENTS_PATTERN if input_type == "Tank" else parsing_utils.LOCATION_SEGMENTS_PATTERN,
+        output_format=args.output_format,
+        raw_text=args.raw_text,
+        compact=args.compact,
+        skip_defaults=args.skip_defaults,
+        backend=args.json_backend,
+        projection=get_projection(args, segments_group_class),
+    )
 
-# simulation = 126
+    for summary in calls_summaries:
+        if summary["status"] == "ok":
+            logger.info("Call %s: %s segments groups (%s failed) in %.2fs", summary["call"], summary["segments_groups"], summary["failed_groups"], summary["duration"])
+        else:
+            logger.error("Call %s failed error_message=%s", summary["call"], summary["error"])
 
-# env = "prod"
+    if corpus_utils.pa is None:
+        logger.warning("pyarrow is not installed, the combined tables of the calls are not written")
+    else:
+        arrow_utils.write_tables(
+            corpus_utils.combine_calls_tables(calls_summaries),
+            os.path.join(output_dir, f"{output_json_name}_calls"),
+            file_format=args.output_format if tables_output else "parquet",
+        )
 
-base_dir = os.path.dirname(__file__)
-parent_dir = os.path.dirname(base_dir)
+    python_utils.write_json(
+        [{key: value for key, value in summary.items() if key != "tables"} for summary in calls_summaries],
+        os.path.join(output_dir, f"{output_json_name}_calls.json"),
+    )
 
-print(base_dir)
-print(parent_dir)
 
-input_dir = os.path.join(
-    parent_dir,
-    "data",
-    "simulations",
-    f"simulation_{simulation}_{env}",
-    "in",
-)
+def check_if_test(args_type, input_type):
+    if "test" in str(args_type).lower():
+        return f"{input_type}_test"
+    return input_type
 
-output_dir = os.path.join(
-    parent_dir,
-    "output_data",
-    f"simulation_{simulation}_{env}",
-)
 
-try:
-    onboard_path = glob.glob(os.path.join(input_dir, f"*/{input_type}.edi"))[0]
-except Exception as e:
-    print("File onboard_path does not exist ! Not .edi file found", e)
-    traceback.print_exc()
+def iter_messages_segments_groups(parsed_messages, messages_metadata: list):
+    """Yields the parsed segments groups of each message in turn, appending to messages_metadata the metadata of each message
+    with the position of its segments groups in the output."""
+    first_segment_group = 0
+    for message, segments_groups in parsed_messages:
+        messages_metadata.append({**message.get_metadata(), "first_segment_group": first_segment_group, "segments_groups_count": len(segments_groups)})
+        first_segment_group += len(segments_groups)
+        yield from segments_groups
 
-onboard_locations = parsing_utils.read_edi_segments(
-    edi_file_path=onboard_path,
-    segments_pattern=r"LOC\+147.*?CNT\+8:\d+(?::\d+)?'",
-)
 
 edi_string = """LOC+147+0140014:9711:5'
 EQD+CN+CMAU7889682:6346:5+45G1:6346:5+++5'
@@ -105,26 +158,189 @@ LOC+9+DEHAM'
 LOC+12+CNSHA'
 CNT+8:1'"""
 
-try:
 
-    onboard_locations = parsing_utils.read_edi_segments(
-        edi_file_path=onboard_path,
-        # edi_string=edi_string,
-        segments_pattern=r"LOC\+147.*?CNT\+8:\d+(?::\d+)?'",
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    if args.split_messages and (args.incremental or args.cache_dir):
+        parser.error("--split-messages cannot be combined with --incremental or --cache-dir")
+    if args.corpus is not None and (args.split_messages or args.incremental or args.cache_dir):
+        parser.error("--corpus cannot be combined with --split-messages, --incremental or --cache-dir")
+
+    logging_utils.configure_logging(args.log_level, logging_utils.parse_module_levels(args.log_module))
+
+    simulation = args.simulation
+    env = args.env
+
+    parsing_utils.set_element_splitter(args.element_splitter)
+
+    if str(args.type).lower() in ("onboard", "o", 1):
+        input_type = "OnBoard"
+    elif str(args.type).lower() in ("loadlist", "l", 0):
+        input_type = "LoadList"
+    elif str(args.type).lower() in ("tank", "t", 2):
+        input_type = "Tank"
+    else:
+        raise ValueError("Invalid processing type, only ('loadlist', 'l', 0) or ('onboard', 1, o) or ('tank', 'l', 2) are allowed !")
+
+
+    # simulation = 126
+
+    # env = "prod"
+
+    base_dir = os.path.dirname(__file__)
+    parent_dir = os.path.dirname(base_dir)
+
+    logger.info("base_dir=%s", base_dir)
+    logger.info("parent_dir=%s", parent_dir)
+
+    input_dir = os.path.join(
+        parent_dir,
+        "data",
+        "simulations",
+        f"simulation_{simulation}_{env}",
+        "in",
     )
 
-    onboard_segments_groups = baplie_segments_groups.LocationSegmentGroup.parse_segments_groups(onboard_locations)
+    output_dir = args.output_dir or os.path.join(
+        parent_dir,
+        "output_data",
+        f"simulation_{simulation}_{env}",
+    )
 
-    onboard_data = python_utils.as_dict(onboard_segments_groups)
+    if args.corpus is not None:
+        run_corpus(args, input_type, args.corpus or input_dir, output_dir)
+        sys.exit(0)
 
-    output_json_name = check_if_test(args.type, input_type)
-    output_file = f"{output_dir}/{output_json_name}.json"
-    python_utils.write_json(onboard_data, output_file)
+    try:
+        onboard_path = glob.glob(os.path.join(input_dir, f"*/{input_type}.edi"))[0]
+    except Exception as e:
+        logger.exception("File onboard_path does not exist ! Not .edi file found %s", e)
+
+    try:
+
+        onboard_locations = parsing_utils.read_edi_segments(
+            edi_file_path=onboard_path,
+            # edi_string=edi_string,
+            segments_pattern=parsing_utils.TANK_SEGMENTS_PATTERN if input_type == "Tank" else parsing_utils.LOCATION_SEGMENTS_PATTERN,
+            stream=not args.mmap,
+            memory_map=args.mmap,
+        )
+
+        segments_group_class = baplie_segments_groups.TankSegmentGroup if input_type == "Tank" else baplie_segments_groups.LocationSegmentGroup
+
+        projection = get_projection(args, segments_group_class)
+
+        output_json_name = check_if_test(args.type, input_type)
+        tables_output = args.output_format in arrow_utils.TABLES_FORMATS
+
+        parse_options = dict(
+            segments_pattern=parsing_utils.TANK_SEGMENTS_PATTERN if input_type == "Tank" else parsing_utils.LOCATION_SEGMENTS_PATTERN,
+            element_splitter=args.element_splitter,
+            projection=projection,
+        )
+
+        revision = None
+        if args.incremental:
+            if args.cache_dir:
+                logger.warning("The parse cache is not used with --incremental, every revision is compared to the previous one")
+                args.cache_dir = None
+
+            revision_state_path = f"{output_dir}/{output_json_name}.revision"
+            revision = revision_utils.RevisionTracker(
+                revision_utils.load_revision_state(revision_state_path),
+                cache_utils.get_parse_key(segments_group_class, **parse_options),
+            )
+
+        # Parsed segments groups are cached for JSON outputs, and their tables (which load much faster) for tables outputs
+        cache = cache_utils.ParseCache(args.cache_dir, args.cache_max_size << 20) if args.cache_dir else None
+        if cache is not None:
+            cache_key = cache.get_key(onboard_path, segments_group_class, **parse_options, tables_raw_text=args.raw_text if tables_output else None)
+            cached = cache.load(cache_key)
+        else:
+            cached = None
+
+        if cached is not None:
+            logger.info("Loaded parsed %s from the parse cache %s", onboard_path, args.cache_dir)
+            onboard_segments_groups = cached
+            metrics = metrics_utils.ParseMetrics(sinks=[])
+        else:
+            metrics = metrics_utils.ParseMetrics(
+                sinks=metrics_utils.get_progress_sinks(args.progress),
+                total_bytes=os.path.getsize(onboard_path),
+            )
+
+            # The segments groups are written as they are parsed, so the output file is written while parsing goes on
+            if args.split_messages:
+                messages = parsing_utils.read_edi_messages(edi_file_path=onboard_path, strict=args.strict_messages)
+                logger.info("Read %s messages from %s", len(messages), onboard_path)
+
+                messages_metadata = []
+                onboard_segments_groups = iter_messages_segments_groups(
+                    segments_group_class.iter_parse_messages(
+                        messages,
+                        parse_options["segments_pattern"],
+                        workers=args.workers,
+                        chunk_size=args.chunk_size,
+                        metrics=metrics,
+                        projection=projection,
+                    ),
+                    messages_metadata,
+                )
+            else:
+                onboard_segments_groups = segments_group_class.iter_parse_segments_groups(
+                    onboard_locations,
+                    workers=args.workers,
+                    chunk_size=args.chunk_size,
+                    metrics=metrics,
+                    projection=projection,
+                    revision=revision,
+                )
+
+            cache_value = []
+            if cache is not None and not tables_output:
+                onboard_segments_groups = cache_utils.iter_and_collect(onboard_segments_groups, cache_value)
+
+        with metrics:
+            if tables_output:
+                output_tables_dir = f"{output_dir}/{output_json_name}"
+
+                if cached is not None:
+                    arrow_utils.write_tables(cached, output_tables_dir, file_format=args.output_format)
+                else:
+                    cache_value = arrow_utils.write_segments_groups_tables(segments_group_class, onboard_segments_groups, output_tables_dir, file_format=args.output_format, raw_text=args.raw_text)
+            else:
+                output_file = f"{output_dir}/{output_json_name}.{args.output_format}"
+                python_utils.write_json_stream(
+                    onboard_segments_groups,
+                    output_file,
+                    json_lines=args.output_format == "ndjson",
+                    compact=args.compact,
+                    backend=args.json_backend,
+                    raw_text=args.raw_text,
+                    skip_defaults=args.skip_defaults,
+                )
+
+        if cache is not None and cached is None:
+            cache.store(cache_key, cache_value)
+
+        if args.split_messages:
+            python_utils.write_json(messages_metadata, f"{output_dir}/{output_json_name}.messages.json")
+
+        if revision is not None:
+            revision_utils.save_revision_state(revision_state_path, revision.get_state())
+
+            delta = revision.get_delta()
+            python_utils.write_json(delta, f"{output_dir}/{output_json_name}.delta.json")
+            logger.info(
+                "Revision delta: %s added, %s removed, %s changed and %s unchanged slots",
+                len(delta["added"]), len(delta["removed"]), len(delta["changed"]), delta["unchanged_count"],
+            )
 
-    # print(output_file)
-    # print(onboard_locations)
-    # print(onboard_data)
+        # print(output_file)
+        # print(onboard_locations)
+        # print(onboard_data)
 
-except Exception as e:
-    print(f"Error on main.py parsing call error_message={e}")
-    traceback.print_exc()
\ No newline at end of file
+    except Exception as e:
+        logger.exception("Error on main.py parsing call error_message=%s", e)
\ No newline at end of file
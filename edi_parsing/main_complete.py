@@ -1,53 +1,111 @@
 import os
 import glob
+import time
+import logging
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from utils import parsing_utils
 from utils import python_utils
+from utils import metrics_utils
+from utils import logging_utils
 
+from data_model import baplie_parsers
 from data_model import baplie_segments_groups
 
 simulation = 126
 env = "prod"
-
-base_dir = os.path.dirname(__file__)
-parent_dir = os.path.dirname(base_dir)
-
-input_dir = os.path.join(parent_dir,  f"/data/simulations/simulation_{simulation}_{env}/in")
-output_dir = os.path.join(base_dir,  f"/test_output_data/simulation_{simulation}_{env}")
-
-onboard_path = glob.glob(f"{input_dir}/*/OnBoard.edi")[0]
-tank_path = glob.glob(f"{input_dir}/*/Tank.edi")[0]
-loadlist_path = glob.glob(f"{input_dir}/*/LoadList.edi")[0]
-
-
-onboard_locations = parsing_utils.read_edi_segments(
-    edi_file_path=onboard_path,
-    segments_pattern=r"LOC\+147.*?CNT\+8:\d+(?::\d+)?'",
-)
-
-
-loadlist_locations = parsing_utils.read_edi_segments(
-    edi_file_path=loadlist_path,
-    segments_pattern=r"LOC\+147.*?CNT\+8:\d+(?::\d+)?'",
-)
-
-
-tank_locations = parsing_utils.read_edi_segments(
-    edi_file_path=tank_path,
-    segments_pattern=r"LOC\+ZZZ.*?FTX\+AAI.*?'",
-)
-
-
-tank_segments_groups = baplie_segments_groups.TankSegmentGroup.parse_segments_groups(tank_locations)
-onboard_segments_groups = baplie_segments_groups.LocationSegmentGroup.parse_segments_groups(onboard_locations)
-loadlist_segments_groups = baplie_segments_groups.LocationSegmentGroup.parse_segments_groups(loadlist_locations)
-
-
-onboard_data = python_utils.as_dict(onboard_segments_groups)
-loadlist_data = python_utils.as_dict(loadlist_segments_groups)
-tank_data = python_utils.as_dict(tank_segments_groups)
-
-
-python_utils.write_json(onboard_data, f"{output_dir}/OnBoard.json")
-python_utils.write_json(loadlist_data, f"{output_dir}/LoadList.json")
-python_utils.write_json(tank_data, f"{output_dir}/Tank.json")
\ No newline at end of file
+memory_map = False
+
+# Segments pattern and segments group class of each file type
+FILE_TYPES = {
+    "OnBoard": (parsing_utils.LOCATION_SEGMENTS_PATTERN, baplie_segments_groups.LocationSegmentGroup),
+    "LoadList": (parsing_utils.LOCATION_SEGMENTS_PATTERN, baplie_segments_groups.LocationSegmentGroup),
+    "Tank": (parsing_utils.TANK_SEGMENTS_PATTERN, baplie_segments_groups.TankSegmentGroup),
+}
+
+logger = logging.getLogger("main_complete")
+
+
+def process_file(file_type, input_dir, output_dir, memory_map=False):
+    """Reads, parses and writes to output_dir/{file_type}.json the .edi file of a file type, returns its timings.
+    The segments groups are written as they are parsed, so that writing the file overlaps parsing it."""
+    timings = {"file_type": file_type}
+    start_time = time.perf_counter()
+
+    try:
+        edi_file_path = glob.glob(f"{input_dir}/*/{file_type}.edi")[0]
+        segments_pattern, segments_group_class = FILE_TYPES[file_type]
+
+        segments_groups = parsing_utils.read_edi_segments(
+            edi_file_path=edi_file_path,
+            segments_pattern=segments_pattern,
+            stream=not memory_map,
+            memory_map=memory_map,
+        )
+
+        # Progress bars of the concurrent files would be mixed on stderr, the timings are reported once the file is written
+        metrics = metrics_utils.ParseMetrics(sinks=[], total_bytes=os.path.getsize(edi_file_path))
+        with metrics:
+            segments_groups_count = python_utils.write_json_stream(
+                segments_group_class.iter_parse_segments_groups(segments_groups, metrics=metrics),
+                f"{output_dir}/{file_type}.json",
+            )
+
+        timings.update(
+            status="ok",
+            segments_groups=segments_groups_count,
+            failed_groups=metrics.failed_groups,
+            parse_time=sum(parse_time for _, parse_time in metrics.classes_parse_time.values()),
+        )
+    except Exception:
+        timings.update(status="failed", error=traceback.format_exc())
+
+    timings["duration"] = time.perf_counter() - start_time
+
+    return timings
+
+
+if __name__ == "__main__":
+
+    logging_utils.configure_logging("INFO")
+
+    base_dir = os.path.dirname(__file__)
+    parent_dir = os.path.dirname(base_dir)
+
+    input_dir = os.path.join(parent_dir, "data", "simulations", f"simulation_{simulation}_{env}", "in")
+    output_dir = os.path.join(base_dir, "test_output_data", f"simulation_{simulation}_{env}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    start_time = time.perf_counter()
+
+    # One process per file type: a file failing does not stop the others, and the run takes about as long as the slowest file
+    with ProcessPoolExecutor(
+        max_workers=len(FILE_TYPES),
+        initializer=baplie_parsers.initialize_parsing_worker,
+        initargs=(parsing_utils.element_splitter, logging_utils.logging_configuration),
+    ) as executor:
+        futures = {executor.submit(process_file, file_type, input_dir, output_dir, memory_map): file_type for file_type in FILE_TYPES}
+
+        files_timings = []
+        for future in as_completed(futures):
+            try:
+                timings = future.result()
+            except Exception:
+                # The worker processing the file died
+                timings = {"file_type": futures[future], "status": "failed", "error": traceback.format_exc(), "duration": time.perf_counter() - start_time}
+            files_timings.append(timings)
+
+            if timings["status"] == "ok":
+                logger.info(
+                    "%s: %s segments groups (%s failed) parsed and written in %.2fs, parse time %.2fs",
+                    timings["file_type"], timings["segments_groups"], timings["failed_groups"], timings["duration"], timings["parse_time"],
+                )
+            else:
+                logger.error("%s failed after %.2fs error_message=%s", timings["file_type"], timings["duration"], timings["error"])
+
+    logger.info(
+        "Processed %s files in %.2fs (%.2fs one after the other)",
+        len(files_timings), time.perf_counter() - start_time, sum(timings["duration"] for timings in files_timings),
+    )
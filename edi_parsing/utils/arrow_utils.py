@@ -0,0 +1,185 @@
+import os
+import json
+import logging
+
+from typing import get_args, Iterable
+from operator import attrgetter
+from dataclasses import dataclass, fields, is_dataclass
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = pq = None
+
+from utils.parsing_utils import RawText
+
+
+logger = logging.getLogger(__name__)
+
+# Table of the segments groups themselves, the other tables are named after the dotted path of their list field (e.g. EQD_CN.DGS)
+ROOT_TABLE = "groups"
+
+# Join keys: row number of a table, and row number of the parent table row holding the list (null in the root table)
+ID_COLUMN = "_id"
+PARENT_ID_COLUMN = "_parent_id"
+
+TABLES_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+
+def require_pyarrow():
+  if pa is None:
+    raise ImportError("parquet and arrow outputs require pyarrow (pip install pyarrow)")
+
+
+
+@dataclass(frozen=True)
+class TableLayout:
+  """Columns of a table as (column, getter, annotated type), and its child tables as (table, getter of the list, layout)."""
+
+  name: str
+  columns: tuple
+  children: tuple
+
+
+
+def get_table_layout(cls: type, name: str = ROOT_TABLE, raw_text: str = "include") -> TableLayout:
+  """Maps a segments group dataclass to tables: nested dataclasses are flattened into dotted columns
+  (e.g. EQD.equipment_identification.equipment_identifier) and each list of dataclasses becomes a child table."""
+
+  columns, children = [], []
+  add_layout_fields(cls, name, "", raw_text, columns, children)
+
+  return TableLayout(name, tuple(columns), tuple(children))
+
+
+
+def add_layout_fields(cls: type, table: str, prefix: str, raw_text: str, columns: list, children: list):
+
+  for field in fields(cls):
+    path = f"{prefix}{field.name}"
+    field_type = field.type
+    subtype = get_args(field_type)[0] if len(get_args(field_type)) == 1 else None
+
+    if field_type is RawText:
+      getter = attrgetter(path)
+      if raw_text == "include":
+        columns.append((path, lambda obj, getter=getter: getter(obj).text, str))
+      elif raw_text == "offsets":
+        columns.append((f"{path}.start", lambda obj, getter=getter: getter(obj).span[0], int))
+        columns.append((f"{path}.end", lambda obj, getter=getter: getter(obj).span[1], int))
+    elif is_dataclass(field_type):
+      add_layout_fields(field_type, table, f"{path}.", raw_text, columns, children)
+    elif subtype is not None and is_dataclass(subtype):
+      child = path if table == ROOT_TABLE else f"{table}.{path}"
+      children.append((child, attrgetter(path), get_table_layout(subtype, child, raw_text)))
+    else:
+      # Values of fields without decoder stay strings whatever their annotation (see parsing_utils.get_field_decoder)
+      raw_strings = "decoder" in field.metadata and field.metadata["decoder"] is None
+      columns.append((path, attrgetter(path), str if raw_strings else field_type))
+
+
+
+def get_arrow_type(field_type: type):
+
+  return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}.get(field_type, pa.string())
+
+
+
+def build_column(table: str, column: str, values: list, field_type: type):
+  """Builds a typed column, or a string column (composites as JSON) when the values do not match the annotation."""
+
+  try:
+    return pa.array(values, type=get_arrow_type(field_type))
+  except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+    logger.warning("Column %s of table %s does not match its %s annotation, it is written as strings", column, table, field_type)
+    return pa.array([value if value is None or isinstance(value, str) else json.dumps(value) for value in values], type=pa.string())
+
+
+
+class TablesBuilder:
+  """Accumulates parsed segments groups into one table per level: the groups, then one table per list of segments
+  or segments groups (equipments, dangerous goods, handlings, measurements...), joined by ID_COLUMN and PARENT_ID_COLUMN."""
+
+  def __init__(self, segments_group_class: type, raw_text: str = "include"):
+    require_pyarrow()
+    self.layout = get_table_layout(segments_group_class, raw_text=raw_text)
+    self.layouts = {}
+    self.columns = {}
+    self.add_table(self.layout)
+
+  def add_table(self, layout: TableLayout):
+    self.layouts[layout.name] = layout
+    self.columns[layout.name] = {column: [] for column in (ID_COLUMN, PARENT_ID_COLUMN, *(column for column, _, _ in layout.columns))}
+
+    for _, _, child_layout in layout.children:
+      self.add_table(child_layout)
+
+  def add(self, segments_group):
+    self.add_row(self.layout, segments_group, None)
+
+  def add_row(self, layout: TableLayout, obj, parent_id):
+    table = self.columns[layout.name]
+    row_id = len(table[ID_COLUMN])
+
+    table[ID_COLUMN].append(row_id)
+    table[PARENT_ID_COLUMN].append(parent_id)
+
+    for column, getter, _ in layout.columns:
+      table[column].append(getter(obj))
+
+    for _, getter, child_layout in layout.children:
+      for item in getter(obj) or ():
+        self.add_row(child_layout, item, row_id)
+
+  def to_tables(self) -> dict:
+    tables = {}
+
+    for name, layout in self.layouts.items():
+      columns = self.columns[name]
+      types = {ID_COLUMN: int, PARENT_ID_COLUMN: int, **{column: field_type for column, _, field_type in layout.columns}}
+      tables[name] = pa.table({column: build_column(name, column, values, types[column]) for column, values in columns.items()})
+
+    return tables
+
+
+
+def write_tables(tables: dict, directory: str, file_format: str = "parquet"):
+  """Writes each table to directory/<table>.parquet, or to an Arrow IPC file directory/<table>.arrow."""
+
+  require_pyarrow()
+  os.makedirs(directory, exist_ok=True)
+
+  for name, table in tables.items():
+    path = os.path.join(directory, f"{name}{TABLES_FORMATS[file_format]}")
+
+    if file_format == "parquet":
+      pq.write_table(table, path)
+    else:
+      with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    logger.info("Wrote %s rows to %s", table.num_rows, path)
+
+
+
+def build_segments_groups_tables(segments_group_class: type, segments_groups: Iterable, raw_text: str = "include") -> dict:
+  """Returns the tables of parsed segments groups, one per level (see TablesBuilder)."""
+
+  builder = TablesBuilder(segments_group_class, raw_text=raw_text)
+
+  for segments_group in segments_groups:
+    builder.add(segments_group)
+
+  return builder.to_tables()
+
+
+
+def write_segments_groups_tables(segments_group_class: type, segments_groups: Iterable, directory: str, file_format: str = "parquet", raw_text: str = "include") -> dict:
+  """Writes parsed segments groups as one table per level (see TablesBuilder), returns the tables."""
+
+  tables = build_segments_groups_tables(segments_group_class, segments_groups, raw_text)
+  write_tables(tables, directory, file_format)
+
+  return tables
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import zlib
+import pickle
+import hashlib
+import logging
+import tempfile
+
+from typing import get_args, Iterable
+from dataclasses import fields, is_dataclass, MISSING
+
+from utils import parsing_utils
+
+
+logger = logging.getLogger(__name__)
+
+# Changes of the entries layout must bump this version, so that older entries are not read
+CACHE_FORMAT_VERSION = 1
+CACHE_MAGIC = b"EDIPARSECACHE%d\n" % CACHE_FORMAT_VERSION
+CACHE_ENTRY_EXTENSION = ".cache"
+
+DEFAULT_CACHE_MAX_BYTES = 1 << 30
+
+# Temporary files left by interrupted writes are removed after this many seconds
+STALE_TEMPORARY_FILE_AGE = 3600
+
+# Schema fingerprints by segments group class, see get_schema_fingerprint
+fingerprints = {}
+
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+  """Returns the sha256 hex digest of a file content."""
+
+  digest = hashlib.sha256()
+
+  with open(file_path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      digest.update(chunk)
+
+  return digest.hexdigest()
+
+
+
+def describe_value(value) -> str:
+  """Describes a field default or metadata value by its qualified name (functions, classes) or repr, stable across runs."""
+
+  if hasattr(value, "__qualname__"):
+    return f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+  if hasattr(value, "pattern"):
+    return value.pattern
+  return repr(value)
+
+
+
+def describe_schema(cls: type, schema: dict, modules: set):
+  """Adds to schema the fields (name, type, default, metadata) of cls and of the dataclasses of its fields,
+  and to modules the modules defining them."""
+
+  if cls.__qualname__ in schema:
+    return
+
+  schema[cls.__qualname__] = description = []
+  modules.update(klass.__module__ for klass in cls.__mro__ if klass is not object)
+
+  for field in fields(cls):
+    default = field.default if field.default_factory is MISSING else field.default_factory
+    description.append([
+      field.name,
+      describe_value(field.type) if isinstance(field.type, type) else repr(field.type),
+      "MISSING" if default is MISSING else describe_value(default),
+      {key: describe_value(value) for key, value in sorted(field.metadata.items())},
+    ])
+
+    for field_class in (field.type, *get_args(field.type)):
+      if is_dataclass(field_class):
+        describe_schema(field_class, schema, modules)
+
+
+
+def get_schema_fingerprint(segments_group_class: type) -> str:
+  """Returns the fingerprint of the parser and model of a segments group class: a digest of the fields of all its
+  (nested) segment and segment group classes, and of the source of the modules defining them and of parsing_utils.
+  Any change of the model or of the parsing code changes the fingerprint."""
+
+  fingerprint = fingerprints.get(segments_group_class)
+
+  if fingerprint is None:
+    schema, modules = {}, {parsing_utils.__name__}
+    describe_schema(segments_group_class, schema, modules)
+
+    digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8"))
+
+    for module_name in sorted(modules):
+      source_file = getattr(sys.modules.get(module_name), "__file__", None)
+      if source_file and os.path.exists(source_file):
+        with open(source_file, "rb") as f:
+          digest.update(f.read())
+
+    fingerprint = digest.hexdigest()
+    fingerprints[segments_group_class] = fingerprint
+
+  return fingerprint
+
+
+
+def get_parse_key(segments_group_class: type, **options) -> str:
+  """Returns the digest of what parsing results depend on besides the file content: the segments group class,
+  its parser and model fingerprint (see get_schema_fingerprint) and the parse options."""
+
+  key = {
+    "fingerprint": get_schema_fingerprint(segments_group_class),
+    "class": f"{segments_group_class.__module__}.{segments_group_class.__qualname__}",
+    "options": options,
+  }
+  return hashlib.sha256(json.dumps(key, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+
+
+def read_entry(path: str):
+  """Returns the value written by write_entry at path, or None if there is none (or it is unreadable, it is then removed)."""
+
+  try:
+    with open(path, "rb") as f:
+      data = f.read()
+  except FileNotFoundError:
+    return None
+
+  try:
+    if not data.startswith(CACHE_MAGIC):
+      raise ValueError(f"{path} is not a version {CACHE_FORMAT_VERSION} cache entry")
+    return pickle.loads(zlib.decompress(data[len(CACHE_MAGIC):]))
+  except Exception as e:
+    logger.warning("Removing unreadable cache entry %s error_message=%s", path, e)
+    remove_file(path)
+    return None
+
+
+
+def write_entry(path: str, value) -> int:
+  """Writes CACHE_MAGIC then the zlib compressed pickle of value to path, atomically: to a temporary file which is fsynced
+  then renamed, so that concurrent readers only ever read complete entries. Returns the number of bytes written."""
+
+  directory = os.path.dirname(path) or "."
+  os.makedirs(directory, exist_ok=True)
+  data = CACHE_MAGIC + zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+  file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+  try:
+    with os.fdopen(file_descriptor, "wb") as f:
+      f.write(data)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+  except BaseException:
+    remove_file(temporary_path)
+    raise
+
+  return len(data)
+
+
+
+def remove_file(path: str):
+  try:
+    os.remove(path)
+  except FileNotFoundError:
+    pass
+
+
+
+def iter_and_collect(iterable: Iterable, collected: list):
+  """Yields the items of iterable, appending them to collected, e.g. to store parsed segments groups once they are all written."""
+
+  for item in iterable:
+    collected.append(item)
+    yield item
+
+
+
+class ParseCache:
+  """On-disk cache of parse results, keyed by the EDI file content, the parser and model fingerprint and the parse options.
+
+  An entry is one file written by write_entry, holding parsed segments groups or their tables. Concurrent runs only
+  ever read complete entries, and a run reading an entry being evicted by another one sees a miss. Reading an entry marks it as used: once the entries
+  exceed max_bytes, the least recently used ones are removed."""
+
+  def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+    self.directory = directory
+    self.max_bytes = max_bytes
+
+  def get_key(self, edi_file_path: str, segments_group_class: type, **options) -> str:
+    key = {"file": hash_file(edi_file_path), "parse": get_parse_key(segments_group_class, **options)}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+  def get_path(self, key: str) -> str:
+    return os.path.join(self.directory, f"{key}{CACHE_ENTRY_EXTENSION}")
+
+  def load(self, key: str):
+    """Returns the cached value of key, or None on a miss (or an unreadable entry, which is removed)."""
+
+    path = self.get_path(key)
+    value = read_entry(path)
+
+    if value is None:
+      logger.debug("Parse cache miss %s", key)
+      return None
+
+    try:
+      os.utime(path)
+    except OSError:
+      pass
+
+    logger.debug("Parse cache hit %s", key)
+    return value
+
+  def store(self, key: str, value):
+    """Writes the value of key atomically, then evicts the least recently used entries over max_bytes."""
+
+    size = write_entry(self.get_path(key), value)
+
+    logger.debug("Stored %s bytes in parse cache entry %s", size, key)
+    self.evict()
+
+  def evict(self):
+    entries = []
+    now = time.time()
+
+    for file_name in os.listdir(self.directory):
+      path = os.path.join(self.directory, file_name)
+      try:
+        stat = os.stat(path)
+      except FileNotFoundError:
+        continue
+
+      if file_name.endswith(CACHE_ENTRY_EXTENSION):
+        entries.append((stat.st_mtime, stat.st_size, path))
+      elif file_name.endswith(".tmp") and now - stat.st_mtime > STALE_TEMPORARY_FILE_AGE:
+        remove_file(path)
+
+    total_bytes = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+      if total_bytes <= self.max_bytes:
+        break
+      logger.debug("Evicting parse cache entry %s", path)
+      remove_file(path)
+      total_bytes -= size
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import logging
+import traceback
+
+from typing import List
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+  import pyarrow as pa
+  import pyarrow.compute as pc
+except ImportError:
+  pa = pc = None
+
+from utils import arrow_utils
+from utils import python_utils
+from utils import parsing_utils
+from utils import logging_utils
+from utils import metrics_utils
+
+from data_model.baplie_parsers import initialize_parsing_worker
+
+
+logger = logging.getLogger(__name__)
+
+# Call folders of a service or simulation, e.g. call_03_SGSIN (call index 3 at port SGSIN) or call_01
+CALL_FOLDER_PATTERN = re.compile(r"call_(\d+)(?:_(.+))?")
+
+# Columns added to every combined table, identifying the call of each row
+CALL_INDEX_COLUMN = "_call_index"
+CALL_PORT_COLUMN = "_call_port"
+
+
+
+@dataclass(frozen=True)
+class CallFolder:
+  index: int
+  port: str
+  name: str
+  edi_file_path: str
+
+
+
+def discover_calls(directory: str, input_type: str) -> List[CallFolder]:
+  """Returns the call folders of a service or simulation directory holding an {input_type}.edi file, by call index."""
+
+  calls = []
+
+  for name in sorted(os.listdir(directory)):
+    match = CALL_FOLDER_PATTERN.fullmatch(name)
+    edi_file_path = os.path.join(directory, name, f"{input_type}.edi")
+
+    if match is None or not os.path.isdir(os.path.join(directory, name)):
+      continue
+    if not os.path.exists(edi_file_path):
+      logger.debug("Call folder %s has no %s.edi file", name, input_type)
+      continue
+
+    calls.append(CallFolder(int(match.group(1)), match.group(2) or "", name, edi_file_path))
+
+  return sorted(calls, key=lambda call: (call.index, call.name))
+
+
+
+def parse_call(call: CallFolder, segments_group_class: type, segments_pattern: str, output_path: str, output_format: str = "json", raw_text: str = "include",
+               compact: bool = False, skip_defaults: bool = False, backend: str = "json", projection: dict = None) -> dict:
+  """Parses the .edi file of a call and writes it to output_path (a file, or a directory for tables output formats).
+
+  Returns the summary of the call (segments groups count, failed groups, duration, or the error if it failed) and, under "tables",
+  its tables (see arrow_utils.build_segments_groups_tables) for the combined tables, or None if pyarrow is not installed."""
+
+  summary = {"call_index": call.index, "call_port": call.port, "call": call.name, "edi_file_path": call.edi_file_path}
+  start_time = time.perf_counter()
+
+  try:
+    segments_groups = parsing_utils.read_edi_segments(segments_pattern, edi_file_path=call.edi_file_path, stream=True)
+
+    metrics = metrics_utils.ParseMetrics(sinks=[], total_bytes=os.path.getsize(call.edi_file_path))
+    with metrics:
+      parsed_segments_groups = list(segments_group_class.iter_parse_segments_groups(segments_groups, metrics=metrics, projection=projection))
+
+    if output_format in arrow_utils.TABLES_FORMATS:
+      tables = arrow_utils.write_segments_groups_tables(segments_group_class, parsed_segments_groups, output_path, output_format, raw_text)
+    else:
+      python_utils.write_json_stream(parsed_segments_groups, output_path, json_lines=output_format == "ndjson", compact=compact, backend=backend, raw_text=raw_text, skip_defaults=skip_defaults)
+      tables = arrow_utils.build_segments_groups_tables(segments_group_class, parsed_segments_groups, raw_text) if pa is not None else None
+
+    summary.update(status="ok", segments_groups=len(parsed_segments_groups), failed_groups=metrics.failed_groups, tables=tables)
+  except Exception:
+    summary.update(status="failed", error=traceback.format_exc(), tables=None)
+
+  summary["duration"] = time.perf_counter() - start_time
+
+  return summary
+
+
+
+def combine_calls_tables(calls_summaries: list) -> dict:
+  """Concatenates the tables of the calls, table by table, adding CALL_INDEX_COLUMN and CALL_PORT_COLUMN to each row.
+  The join keys of each call are offset by the rows of the previous calls, so that they stay unique in the combined tables."""
+
+  combined = {}
+  offsets = {}
+
+  for summary in calls_summaries:
+    tables = summary.get("tables")
+    if not tables:
+      continue
+
+    for name, table in tables.items():
+      offset = offsets.get(name, 0)
+      parent_offset = offsets.get(get_parent_table(name, tables), 0)
+
+      table = table.set_column(table.schema.get_field_index(arrow_utils.ID_COLUMN), arrow_utils.ID_COLUMN, pc.add(table[arrow_utils.ID_COLUMN], offset))
+      table = table.set_column(table.schema.get_field_index(arrow_utils.PARENT_ID_COLUMN), arrow_utils.PARENT_ID_COLUMN, pc.add(table[arrow_utils.PARENT_ID_COLUMN], parent_offset))
+      table = table.append_column(CALL_INDEX_COLUMN, pa.array([summary["call_index"]] * table.num_rows, type=pa.int64()))
+      table = table.append_column(CALL_PORT_COLUMN, pa.array([summary["call_port"]] * table.num_rows, type=pa.string()))
+
+      combined.setdefault(name, []).append(table)
+
+    for name, table in tables.items():
+      offsets[name] = offsets.get(name, 0) + table.num_rows
+
+  return {name: concat_tables(name, tables) for name, tables in combined.items()}
+
+
+
+def concat_tables(name: str, tables: list):
+  """Concatenates tables, promoting the columns typed differently by different calls (see arrow_utils.build_column)
+  to a common type, or to strings when there is none."""
+
+  try:
+    return pa.concat_tables(tables, promote_options="permissive")
+  except (pa.ArrowInvalid, pa.ArrowTypeError):
+    types = {}
+    for table in tables:
+      for field in table.schema:
+        if not pa.types.is_null(field.type):
+          types.setdefault(field.name, set()).add(field.type)
+
+    string_columns = [column for column, column_types in types.items() if len(column_types) > 1]
+    logger.warning("Columns %s of table %s have different types in different calls, they are written as strings", string_columns, name)
+
+    return pa.concat_tables([cast_to_strings(table, string_columns) for table in tables], promote_options="permissive")
+
+
+
+def cast_to_strings(table, columns: list):
+
+  for column in columns:
+    if column in table.column_names:
+      index = table.schema.get_field_index(column)
+      table = table.set_column(index, column, pc.cast(table[column], pa.string()))
+
+  return table
+
+
+
+def get_parent_table(name: str, tables: dict) -> str:
+  """Returns the table holding the rows of which the rows of table name are children (None for the root table)."""
+
+  if name == arrow_utils.ROOT_TABLE:
+    return None
+
+  parents = [table for table in tables if table != arrow_utils.ROOT_TABLE and name.startswith(f"{table}.")]
+
+  return max(parents, key=len) if parents else arrow_utils.ROOT_TABLE
+
+
+
+def parse_calls(calls: List[CallFolder], get_output_path, workers: int = 1, **parse_options) -> list:
+  """Parses the calls (see parse_call), calls at a time in a process pool with more than one worker,
+  get_output_path(call) giving the output of each call. Returns the calls summaries, by call index."""
+
+  if workers <= 1:
+    return [parse_call(call, output_path=get_output_path(call), **parse_options) for call in calls]
+
+  with ProcessPoolExecutor(
+    max_workers=workers,
+    initializer=initialize_parsing_worker,
+    initargs=(parsing_utils.element_splitter, logging_utils.logging_configuration),
+  ) as executor:
+    futures = [executor.submit(parse_call, call, output_path=get_output_path(call), **parse_options) for call in calls]
+
+    calls_summaries = []
+    for call, future in zip(calls, futures):
+      try:
+        calls_summaries.append(future.result())
+      except Exception:
+        # The worker parsing the call died
+        calls_summaries.append({
+          "call_index": call.index, "call_port": call.port, "call": call.name, "edi_file_path": call.edi_file_path,
+          "status": "failed", "error": traceback.format_exc(), "tables": None, "duration": None,
+        })
+
+    return calls_summaries
@@ -0,0 +1,39 @@
+import logging
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s : %(message)s"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# (level, module_levels) of the last configure_logging call, so that worker processes can be configured the same way
+logging_configuration = None
+
+
+
+def parse_module_levels(module_levels: list) -> dict:
+  """Parses module verbosity switches such as ["data_model.baplie_parsers=DEBUG", "utils.parsing_utils=WARNING"]."""
+
+  levels = {}
+
+  for module_level in module_levels or []:
+    module, separator, level = module_level.partition("=")
+
+    if not separator or level.upper() not in LOG_LEVELS:
+      raise ValueError(f"Invalid module log level {module_level!r}, expected module=LEVEL with LEVEL in {LOG_LEVELS}")
+
+    levels[module] = level.upper()
+
+  return levels
+
+
+
+def configure_logging(level: str = "INFO", module_levels: dict = None):
+  """Sets the level of all loggers, then overrides it for the given modules (a module level also applies to its submodules)."""
+
+  global logging_configuration
+
+  logging.basicConfig(format=LOG_FORMAT, level=level.upper(), force=True)
+
+  for module, module_level in (module_levels or {}).items():
+    logging.getLogger(module).setLevel(module_level)
+
+  logging_configuration = (level, dict(module_levels or {}))
@@ -0,0 +1,207 @@
+import sys
+import json
+import time
+
+
+# Minimum number of seconds between two progress emissions (the final snapshot is always emitted)
+DEFAULT_EMIT_INTERVAL = 0.5
+
+BAR_WIDTH = 30
+
+
+
+def format_duration(seconds: float) -> str:
+  if seconds is None:
+    return "--:--"
+  minutes, seconds = divmod(int(seconds), 60)
+  hours, minutes = divmod(minutes, 60)
+  return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+
+def format_bytes(bytes_count: float) -> str:
+  for unit in ("B", "KB", "MB", "GB"):
+    if bytes_count < 1024:
+      return f"{bytes_count:.1f} {unit}"
+    bytes_count /= 1024
+  return f"{bytes_count:.1f} TB"
+
+
+
+class StderrBarSink:
+  """Redraws a one line progress bar on stderr."""
+
+  def __init__(self, stream=None):
+    self.stream = stream or sys.stderr
+
+  def emit(self, snapshot: dict):
+    if snapshot["progress"] is not None:
+      filled = int(snapshot["progress"] * BAR_WIDTH)
+      bar = f"[{'#' * filled}{'.' * (BAR_WIDTH - filled)}] {snapshot['progress']*100:6.2f}% "
+    else:
+      bar = ""
+
+    total_groups = f"/{snapshot['total_groups']}" if snapshot["total_groups"] is not None else ""
+
+    self.stream.write(
+      f"\r{bar}{snapshot['groups']}{total_groups} groups ({snapshot['failed_groups']} failed)"
+      f" | {snapshot['groups_per_second']:.1f} groups/s"
+      f" | {snapshot['segments_per_second']:.1f} segments/s"
+      f" | {format_bytes(snapshot['bytes_per_second'])}/s"
+      f" | elapsed {format_duration(snapshot['elapsed'])} ETA {format_duration(snapshot['eta'])} "
+    )
+    self.stream.flush()
+
+  def close(self, snapshot: dict):
+    self.emit(snapshot)
+    self.stream.write("\n")
+    for class_name, (groups, parse_time) in snapshot["classes_parse_time"].items():
+      self.stream.write(f"{class_name} : {groups} groups parsed in {parse_time:.3f}s ({parse_time/groups*1000:.3f} ms/group)\n")
+    self.stream.flush()
+
+
+
+class JsonLinesSink:
+  """Writes each snapshot as one JSON line, the last one having "final": true."""
+
+  def __init__(self, stream=None):
+    self.stream = stream or sys.stderr
+
+  def emit(self, snapshot: dict):
+    self.stream.write(json.dumps(snapshot) + "\n")
+    self.stream.flush()
+
+  def close(self, snapshot: dict):
+    self.emit({**snapshot, "final": True})
+
+
+
+class CallbackSink:
+  """Calls callback(snapshot) on each emission, and callback(snapshot, final=True) once parsing is over."""
+
+  def __init__(self, callback):
+    self.callback = callback
+
+  def emit(self, snapshot: dict):
+    self.callback(snapshot)
+
+  def close(self, snapshot: dict):
+    self.callback(snapshot, final=True)
+
+
+
+PROGRESS_SINKS = {
+  "bar": StderrBarSink,
+  "json": JsonLinesSink,
+  "none": None,
+}
+
+
+
+class ParseMetrics:
+  """Tracks the throughput of a segments groups parse: groups, segments and bytes per second, ETA and parse time per class.
+
+  Recording a group is O(1) (a few counters increments), snapshots are sent to the sinks at most every interval seconds.
+  The ETA is computed from total_bytes if given (e.g. the .edi file size, as streamed inputs have no known length),
+  from total_groups otherwise. Use it as a context manager, the final snapshot is emitted when leaving it."""
+
+  def __init__(self, sinks: list = None, total_groups: int = None, total_bytes: int = None, interval: float = DEFAULT_EMIT_INTERVAL):
+    self.sinks = list(sinks) if sinks is not None else [StderrBarSink()]
+    self.total_groups = total_groups
+    self.total_bytes = total_bytes
+    self.interval = interval
+
+    self.groups = 0
+    self.failed_groups = 0
+    self.segments = 0
+    self.bytes = 0
+    self.classes_parse_time = {}
+
+    self.start_time = None
+    self.last_emit_time = None
+
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+  def start(self):
+    self.start_time = self.last_emit_time = time.perf_counter()
+
+
+  def add_group(self, class_name: str, segments_count: int, bytes_count: int, parse_time: float, failed: bool = False):
+    if self.start_time is None:
+      self.start()
+
+    self.groups += 1
+    self.segments += segments_count
+    self.bytes += bytes_count
+
+    if failed:
+      self.failed_groups += 1
+
+    class_parse_time = self.classes_parse_time.get(class_name)
+    if class_parse_time is None:
+      self.classes_parse_time[class_name] = [1, parse_time]
+    else:
+      class_parse_time[0] += 1
+      class_parse_time[1] += parse_time
+
+    now = time.perf_counter()
+    if now - self.last_emit_time >= self.interval:
+      self.last_emit_time = now
+      self.emit()
+
+
+  def get_progress(self):
+    if self.total_bytes:
+      return min(self.bytes / self.total_bytes, 1.0)
+    if self.total_groups:
+      return min(self.groups / self.total_groups, 1.0)
+    return None
+
+
+  def snapshot(self) -> dict:
+    elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+    progress = self.get_progress()
+
+    return {
+      "groups": self.groups,
+      "failed_groups": self.failed_groups,
+      "total_groups": self.total_groups,
+      "segments": self.segments,
+      "bytes": self.bytes,
+      "total_bytes": self.total_bytes,
+      "elapsed": elapsed,
+      "progress": progress,
+      "eta": elapsed * (1 - progress) / progress if progress else None,
+      "groups_per_second": self.groups / elapsed if elapsed else 0.0,
+      "segments_per_second": self.segments / elapsed if elapsed else 0.0,
+      "bytes_per_second": self.bytes / elapsed if elapsed else 0.0,
+      "classes_parse_time": {class_name: tuple(values) for class_name, values in self.classes_parse_time.items()},
+    }
+
+
+  def emit(self):
+    if self.sinks:
+      snapshot = self.snapshot()
+      for sink in self.sinks:
+        sink.emit(snapshot)
+
+
+  def close(self):
+    if self.sinks:
+      snapshot = self.snapshot()
+      for sink in self.sinks:
+        sink.close(snapshot)
+
+
+
+def get_progress_sinks(progress: str) -> list:
+  """Returns the sinks of a progress mode of PROGRESS_SINKS (bar, json or none)."""
+  sink_class = PROGRESS_SINKS[progress]
+  return [sink_class()] if sink_class is not None else []
@@ -1,49 +1,492 @@
 import re
-from typing import Union, List
-from dataclasses import Field
+import os
+import sys
+import mmap
+import logging
+from dataclasses import dataclass, Field
+from typing import Union, List, Iterable, Iterator
 
 
 from pydifact.segmentcollection import RawSegmentCollection
 
 
-def read_edi_segments(segments_pattern: str, edi_file_path:str = None, edi_string:str = None) -> list:
+logger = logging.getLogger(__name__)
+
+
+LOCATION_SEGMENTS_PATTERN = r"LOC\+147.*?CNT\+8:\d+(?::\d+)?'"
+TANK_SEGMENTS_PATTERN = r"LOC\+ZZZ.*?FTX\+AAI.*?'"
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# BAPLIE syntax levels UNOA to UNOC are all subsets of latin-1
+DEFAULT_ENCODING = "latin-1"
+
+
+@dataclass(frozen=True)
+class ServiceString:
+  """Control characters of an EDI file, as advertised by its UNA segment."""
+  component_separator: str = ":"
+  data_separator: str = "+"
+  decimal_mark: str = "."
+  release_character: str = "?"
+  reserved: str = " "
+  segment_terminator: str = "'"
+
+  @classmethod
+  def from_una(cls, una_segment: str):
+    return cls(*una_segment[3:9])
+
+
+DEFAULT_SERVICE_STRING = ServiceString()
+
+ELEMENT_SPLITTERS = ("native", "pydifact", "verify")
+
+# Splitter used to turn segments into elements, see set_element_splitter
+element_splitter = "native"
+
+# How the raw text of the segments groups is exported: the text itself, its (start, end) position in the EDI text, or nothing
+RAW_TEXT_MODES = ("include", "offsets", "omit")
+
+
+
+class RawText:
+  """Reference to the raw text buffer[start:end] of a segments group, only materialized (sliced) when asked for.
+
+  Groups read from a whole EDI text share it as buffer. Groups read chunk by chunk own their text, span is then
+  its (start, end) position in the source EDI text ((start, end) if buffer is the source text itself).
+  RawText is immutable: copies are the object itself, and pickling only sends the referenced text, not the whole buffer."""
+
+  __slots__ = ("buffer", "start", "end", "span")
+
+  def __init__(self, buffer: str, start: int = 0, end: int = None, span: tuple = None):
+    self.buffer = buffer
+    self.start = start
+    self.end = len(buffer) if end is None else end
+    self.span = (self.start, self.end) if span is None else span
+
+  @property
+  def text(self) -> str:
+    if self.start == 0 and self.end == len(self.buffer):
+      return self.buffer
+    return self.buffer[self.start:self.end]
+
+  def __str__(self):
+    return self.text
+
+  def __len__(self):
+    return self.end - self.start
+
+  def __bool__(self):
+    return self.end > self.start
+
+  def __eq__(self, other):
+    if isinstance(other, RawText):
+      return self.text == other.text
+    if isinstance(other, str):
+      return self.text == other
+    return NotImplemented
+
+  def __hash__(self):
+    return hash(self.text)
+
+  def __repr__(self):
+    return f"RawText(span={self.span}, text={self.text!r})"
+
+  def count(self, sub: str) -> int:
+    return self.buffer.count(sub, self.start, self.end)
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+  def __reduce__(self):
+    return (RawText, (self.text, 0, len(self), self.span))
+
+  def export(self, raw_text: str = "include"):
+    """Returns the value exported for this raw text with one of RAW_TEXT_MODES ("omit" is handled by the exporters)."""
+    if raw_text == "offsets":
+      return {"start": self.span[0], "end": self.span[1]}
+    return self.text
+
+
+EMPTY_RAW_TEXT = RawText("")
+
+
+def read_edi_segments(segments_pattern: str, edi_file_path:str = None, edi_string:str = None, stream: bool = False, memory_map: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = DEFAULT_ENCODING) -> List[RawText]:
+  """Returns the segments groups matching segments_pattern, as RawText references into the EDI text.
+  With stream=True, returns a generator reading the file chunk by chunk and yielding one group at a time.
+  With memory_map=True, returns a generator finding the groups on the memory-mapped bytes of the file and decoding each group only when it is consumed."""
   
   if edi_file_path is None and edi_string is None:
       raise ValueError("You must provide either edi_file_path or edi_string.")
   if edi_file_path is not None and edi_string is not None:
       raise ValueError("You can only provide either edi_file_path or edi_string, not both.")
+  if stream and memory_map:
+      raise ValueError("You can only use either stream or memory_map mode, not both.")
+  if memory_map and edi_file_path is None:
+      raise ValueError("memory_map mode requires an edi_file_path.")
+
+  if stream:
+    start_pattern, end_pattern = split_segments_pattern(segments_pattern)
+    return stream_edi_segments_groups(start_pattern, end_pattern, edi_file_path=edi_file_path, edi_string=edi_string, chunk_size=chunk_size, encoding=encoding)
+
+  if memory_map:
+    return map_edi_segments_groups(segments_pattern, edi_file_path, encoding=encoding)
 
   if edi_string:
      edi_content = edi_string
   else:
-    with open(edi_file_path, "r") as f:
+    with open(edi_file_path, "r", encoding=encoding) as f:
        edi_content = f.read()
 
-  segments = re.compile(pattern=segments_pattern, flags=re.DOTALL).findall(edi_content)
+  segments = [
+    RawText(edi_content, match.start(), match.end())
+    for match in re.compile(pattern=segments_pattern, flags=re.DOTALL).finditer(edi_content)
+  ]
 
   return segments
 
 
-def find_last_segment(segment_group):
+def split_segments_pattern(segments_pattern: str) -> tuple:
+  """Splits a 'START.*?END' segments pattern into the patterns of its first and last segments."""
 
-    segments = segment_group.strip().split("'")
+  if ".*?" not in segments_pattern:
+    raise ValueError(f"Cannot stream segments pattern {segments_pattern}, it must be of the form 'START.*?END'.")
 
-    print("FIND LAST SEGMENTS:", segments)
-    print("FIND LAST SEGMENTS REVERSE:", list(reversed(segments)))
+  start_pattern, end_pattern = segments_pattern.split(".*?", 1)
 
-    reversed_segments = [s for s in list(reversed(segments)) if s.strip() != ""]
+  return start_pattern, end_pattern
 
-    for segment in reversed_segments:
-        if segment.strip():
-            return segment.strip() + "'"
 
-    return None
+def read_file_chunks(edi_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = DEFAULT_ENCODING) -> Iterator[str]:
+
+  with open(edi_file_path, "r", encoding=encoding) as f:
+    while True:
+      chunk = f.read(chunk_size)
+      if not chunk:
+        break
+      yield chunk
+
+
+def normalize_segment(segment: str, service_string: ServiceString) -> str:
+  """Rewrites a segment written with a custom UNA service string using the default control characters."""
+
+  mapping = {
+    service_string.component_separator: DEFAULT_SERVICE_STRING.component_separator,
+    service_string.data_separator: DEFAULT_SERVICE_STRING.data_separator,
+    service_string.segment_terminator: DEFAULT_SERVICE_STRING.segment_terminator,
+  }
+  default_control_characters = set(mapping.values()) | {DEFAULT_SERVICE_STRING.release_character}
+
+  normalized = []
+  released = False
+
+  for char in segment:
+    if released:
+      released = False
+      normalized.append(f"{DEFAULT_SERVICE_STRING.release_character}{char}" if char in default_control_characters else char)
+    elif char == service_string.release_character:
+      released = True
+    elif char in mapping:
+      normalized.append(mapping[char])
+    elif char in default_control_characters:
+      normalized.append(f"{DEFAULT_SERVICE_STRING.release_character}{char}")
+    else:
+      normalized.append(char)
+
+  return "".join(normalized)
+
+
+def iter_segments(chunks: Iterable[str]) -> Iterator[str]:
+  """Yields the raw segments (terminator included) of an EDI text given as an iterable of chunks.
+
+  Segments terminators escaped with the release character are not considered as segments ends.
+  If the text starts with a UNA service string, its control characters are used to split the segments,
+  which are then rewritten with the default control characters."""
+
+  for segment, _, _ in iter_segments_spans(chunks):
+    yield segment
+
+
+def iter_segments_spans(chunks: Iterable[str]) -> Iterator[tuple]:
+  """Same as iter_segments, yielding (segment, start, end) with the position of the raw segment in the EDI text."""
+
+  service_string = None
+  buffer = ""
+  # Position of buffer[0] in the EDI text
+  offset = 0
+  chunks = iter(chunks)
+  exhausted = False
+
+  while not exhausted:
+    chunk = next(chunks, None)
+    if chunk is None:
+      exhausted = True
+    else:
+      buffer += chunk
+
+    if service_string is None:
+      if len(buffer.lstrip()) < 9 and not exhausted:
+        continue
+      stripped_buffer = buffer.lstrip()
+      offset += len(buffer) - len(stripped_buffer)
+      buffer = stripped_buffer
+      if buffer.startswith("UNA"):
+        service_string = ServiceString.from_una(buffer)
+        buffer = buffer[9:]
+        offset += 9
+      else:
+        service_string = DEFAULT_SERVICE_STRING
+
+    terminator = service_string.segment_terminator
+    release = service_string.release_character
+    start = 0
+    search_from = 0
+
+    while True:
+      end = buffer.find(terminator, search_from)
+      if end == -1:
+        break
+
+      released_count = 0
+      while end - released_count > start and buffer[end - released_count - 1] == release:
+        released_count += 1
+
+      if released_count % 2 == 1:
+        search_from = end + 1
+        continue
+
+      segment = buffer[start:end + 1]
+      yield segment if service_string is DEFAULT_SERVICE_STRING else normalize_segment(segment, service_string), offset + start, offset + end + 1
+      start = search_from = end + 1
+
+    buffer = buffer[start:]
+    offset += start
+
+  if buffer.strip():
+    yield buffer if service_string is DEFAULT_SERVICE_STRING else normalize_segment(buffer, service_string), offset, offset + len(buffer)
+
+
+def split_segments(segments_string: str) -> list:
+  """Splits a segments string, written with the default control characters, into its segments (leading whitespaces stripped)."""
+
+  if DEFAULT_SERVICE_STRING.release_character in segments_string:
+    return [segment.lstrip() for segment in iter_segments([segments_string])]
+
+  terminator = DEFAULT_SERVICE_STRING.segment_terminator
+  *segments, remainder = segments_string.split(terminator)
+  segments = [f"{segment.lstrip()}{terminator}" for segment in segments]
+
+  if remainder.strip():
+    segments.append(remainder.lstrip())
+
+  return segments
+
+
+def iter_segments_groups(segments_spans: Iterable[tuple], start_pattern: str, end_pattern: str) -> Iterator[RawText]:
+  """Groups segments (given with their spans, see iter_segments_spans) from a segment matching start_pattern
+  up to the next segment matching end_pattern. Segments outside of a group are dropped."""
+
+  start_regex = re.compile(start_pattern, flags=re.DOTALL)
+  end_regex = re.compile(end_pattern, flags=re.DOTALL)
+
+  group = None
+
+  for segment, segment_start, segment_end in segments_spans:
+    stripped_segment = segment.lstrip()
+
+    if group is None:
+      if not start_regex.match(stripped_segment):
+        continue
+      group = [stripped_segment]
+      group_start = segment_start + len(segment) - len(stripped_segment)
+    else:
+      group.append(segment)
+
+    if end_regex.match(stripped_segment):
+      yield RawText("".join(group), span=(group_start, segment_end))
+      group = None
+
+
+def stream_edi_segments_groups(start_pattern: str, end_pattern: str, edi_file_path: str = None, edi_string: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = DEFAULT_ENCODING) -> Iterator[RawText]:
+
+  chunks = [edi_string] if edi_string is not None else read_file_chunks(edi_file_path, chunk_size, encoding)
+
+  return iter_segments_groups(iter_segments_spans(chunks), start_pattern, end_pattern)
+
+
+def map_edi_segments_groups(segments_pattern: str, edi_file_path: str, encoding: str = DEFAULT_ENCODING) -> Iterator[RawText]:
+  """Yields the segments groups matching segments_pattern, searched directly on the memory-mapped bytes of the file.
+
+  segments_pattern is written with the default control characters and does not handle released ones: files starting with
+  a UNA service string or holding a release character are read by stream_edi_segments_groups instead, with a warning."""
+
+  bytes_pattern = re.compile(segments_pattern.encode("ascii"), flags=re.DOTALL)
+  release = DEFAULT_SERVICE_STRING.release_character.encode("ascii")
+
+  with open(edi_file_path, "rb") as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return
 
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as edi_bytes:
+      has_service_string = edi_bytes[:1024].lstrip().startswith(b"UNA")
+      stream = has_service_string or edi_bytes.find(release) != -1
 
-def escape_regex_chars(string: str) -> str:
-  """Escapes all regex-escapable characters of a string."""
-  escaped_string = re.sub(r"([{}\[\]|()])", r"\\\1", string, flags=re.DOTALL)
-  return escaped_string.replace(" ", "\s").replace("+", "\+").replace(".", "\.")
+      if not stream:
+        with memoryview(edi_bytes) as edi_view:
+          for match in bytes_pattern.finditer(edi_bytes):
+            yield RawText(str(edi_view[match.start():match.end()], encoding), span=match.span())
+        return
+
+  logger.warning(
+    "%s %s, it is read as a stream instead of memory-mapped",
+    edi_file_path, "starts with a UNA service string" if has_service_string else "holds release characters",
+  )
+  yield from stream_edi_segments_groups(*split_segments_pattern(segments_pattern), edi_file_path=edi_file_path, encoding=encoding)
+
+
+@dataclass(frozen=True)
+class EdiMessage:
+  """A UNH...UNT message of an interchange (e.g. one BAPLIE or TANSTA message) with its header metadata:
+  the interchange sender and control reference (UNB), the message reference and type (UNH),
+  the vessel IMO number (TDT) and the port of the call (LOC+5). text references the message in the EDI text."""
+  index: int
+  sender: str
+  interchange_reference: str
+  message_reference: str
+  message_type: str
+  vessel_imo: str
+  port: str
+  segments_count: int
+  text: RawText
+
+  def get_metadata(self) -> dict:
+    return {
+      "index": self.index,
+      "sender": self.sender,
+      "interchange_reference": self.interchange_reference,
+      "message_reference": self.message_reference,
+      "message_type": self.message_type,
+      "vessel_imo": self.vessel_imo,
+      "port": self.port,
+      "segments_count": self.segments_count,
+      "span": self.text.span,
+    }
+
+  def read_segments_groups(self, segments_pattern: str) -> List[RawText]:
+    """Returns the segments groups of the message matching segments_pattern, as RawText references into the EDI text."""
+
+    regex = re.compile(pattern=segments_pattern, flags=re.DOTALL)
+    buffer = self.text.buffer
+
+    return [RawText(buffer, match.start(), match.end()) for match in regex.finditer(buffer, self.text.start, self.text.end)]
+
+
+def get_component(element, index: int = 0) -> str:
+  """Returns a component of an element split by split_segment_elements (a string if it has a single component)."""
+
+  if isinstance(element, list):
+    return element[index] if len(element) > index else ""
+  return element if index == 0 else ""
+
+
+def report_interchange_error(message: str, strict: bool = False):
+
+  if strict:
+    raise ValueError(message)
+  logger.error(message)
+
+
+def read_edi_messages(edi_file_path: str = None, edi_string: str = None, strict: bool = False, encoding: str = DEFAULT_ENCODING) -> List[EdiMessage]:
+  """Splits an EDI interchange into its UNH...UNT messages, in file order (see EdiMessage).
+
+  The UNT segments count of each message, and the UNZ messages count of each interchange, are checked
+  while splitting: a mismatch (or a message missing its UNT) is logged as an error, or raised as a ValueError if strict.
+  A text without UNH segment (bare segments groups) is returned as a single message without metadata."""
+
+  if (edi_file_path is None) == (edi_string is None):
+    raise ValueError("You must provide either edi_file_path or edi_string, not both.")
+
+  if edi_string is not None:
+    edi_content = edi_string
+  else:
+    with open(edi_file_path, "r", encoding=encoding) as f:
+      edi_content = f.read()
+
+  messages = []
+  sender = interchange_reference = ""
+  interchange_messages_count = 0
+  message = None
+
+  for segment, segment_start, segment_end in iter_segments_spans([edi_content]):
+    stripped_segment = segment.lstrip()
+    tag = stripped_segment[:3]
+    elements = split_segment_elements(stripped_segment) if tag in ("UNB", "UNH", "UNT", "UNZ", "TDT", "LOC") else None
+
+    if tag == "UNB":
+      sender = get_component(elements[1]) if len(elements) > 1 else ""
+      interchange_reference = get_component(elements[4]) if len(elements) > 4 else ""
+      interchange_messages_count = 0
+
+    elif tag == "UNH":
+      if message is not None:
+        report_interchange_error(f"Message {message['message_reference']} has no UNT segment, it ends at the next UNH segment", strict)
+        messages.append(build_edi_message(edi_content, len(messages), message))
+
+      message = {
+        "sender": sender,
+        "interchange_reference": interchange_reference,
+        "message_reference": get_component(elements[0]) if elements else "",
+        "message_type": ":".join(elements[1]) if len(elements) > 1 and isinstance(elements[1], list) else get_component(elements[1]) if len(elements) > 1 else "",
+        "vessel_imo": "",
+        "port": "",
+        "segments_count": 1,
+        "start": segment_start + len(segment) - len(stripped_segment),
+        "end": segment_end,
+      }
+
+    elif message is not None:
+      message["segments_count"] += 1
+      message["end"] = segment_end
+
+      if tag == "TDT" and not message["vessel_imo"]:
+        # The vessel is identified by its IMO number, the component qualified by IMO (e.g. 9454450:IMO:11:CMA CGM JULES VERNE)
+        message["vessel_imo"] = next((get_component(element) for element in elements if get_component(element, 1) == "IMO"), "")
+      elif tag == "LOC" and not message["port"] and elements and get_component(elements[0]) == "5":
+        message["port"] = get_component(elements[1]) if len(elements) > 1 else ""
+      elif tag == "UNT":
+        declared_count = get_component(elements[0]) if elements else ""
+        reference = get_component(elements[1]) if len(elements) > 1 else ""
+
+        if declared_count != str(message["segments_count"]):
+          report_interchange_error(f"Message {message['message_reference']} UNT segments count is {declared_count} but it has {message['segments_count']} segments", strict)
+        if reference != message["message_reference"]:
+          report_interchange_error(f"Message {message['message_reference']} is ended by the UNT segment of message {reference}", strict)
+
+        messages.append(build_edi_message(edi_content, len(messages), message))
+        interchange_messages_count += 1
+        message = None
+
+    elif tag == "UNZ":
+      declared_count = get_component(elements[0]) if elements else ""
+      if declared_count != str(interchange_messages_count):
+        report_interchange_error(f"Interchange {interchange_reference} UNZ messages count is {declared_count} but it has {interchange_messages_count} messages", strict)
+
+  if message is not None:
+    report_interchange_error(f"Message {message['message_reference']} has no UNT segment, it ends at the end of the file", strict)
+    messages.append(build_edi_message(edi_content, len(messages), message))
+
+  if not messages and edi_content.strip():
+    messages.append(EdiMessage(0, "", "", "", "", "", "", 0, RawText(edi_content)))
+
+  return messages
+
+
+def build_edi_message(edi_content: str, index: int, message: dict) -> EdiMessage:
+  text = RawText(edi_content, message.pop("start"), message.pop("end"))
+  return EdiMessage(index=index, text=text, **message)
 
 
 def get_segment_pattern_from_field(field: Field) -> str:
@@ -67,76 +510,155 @@ def build_field_regex(field: Field) -> str:
   return f"{segment_pattern}{separator}.*?'"
 
 
-def get_segment_strings(field: Field, segments_string: str) -> list:
-  
-  regex_pattern = build_field_regex(field)
+def compile_field_regex(field: Field) -> re.Pattern:
+  """Compiles the regex matching, from its start, a single segment of the field."""
+  return re.compile(pattern=build_field_regex(field), flags=re.DOTALL)
+
+
+def parse_segment(regex_pattern: str, segments_string: str) -> list:
 
   segments = re.compile(pattern=regex_pattern, flags=re.DOTALL).findall(segments_string)
 
-  return segments
+  elements_collection = [get_segments_elements(segment)[0] for segment in segments]
 
+  return elements_collection
 
-def get_segment_groups_string(field: Field, segments_string: str):
 
-  segment_pattern = get_segment_pattern_from_field(field)
-  
-  if 'EQD' in field.name:
-    segment_bloc_pattern = f"({segment_pattern}.*?)(?=EQD\+|$)"
-  else:
-    segment_bloc_pattern = f'({segment_pattern}.*?)(?={segment_pattern}|$)'
+def set_element_splitter(splitter: str):
+  """Selects how segments are split into elements:
+  'native' uses split_segment_elements, 'pydifact' uses pydifact RawSegmentCollection,
+  'verify' runs both, reports any difference and keeps the pydifact result."""
 
+  global element_splitter
 
-  print("FIELD NAME:", field.name, "SEGMENT PATTERN", segment_pattern)
-  print("SEGMENT BLOC PATTERN", segment_bloc_pattern)
+  if splitter not in ELEMENT_SPLITTERS:
+    raise ValueError(f"Invalid element splitter {splitter}, only {ELEMENT_SPLITTERS} are allowed !")
 
-  pattern = re.compile(segment_bloc_pattern, re.DOTALL)
+  element_splitter = splitter
 
-  matches = list(re.finditer(pattern, segments_string))
-  print(f"MATCHES : {matches}")
 
-  segment_groups = []
+def compact_components(components: list):
+  """Shapes the components of an element like pydifact does: trailing empty components are dropped,
+  an element without component is an empty string and an element with a single component is a string."""
 
-  total = len(matches) - 1
+  while components and components[-1] == "":
+    components.pop()
 
-  for index, match in enumerate(matches):
+  if len(components) == 0:
+    return ""
+  if len(components) == 1:
+    return components[0]
+  return components
 
-      print("\n", f"{index} : SEGMENT GROUP {index}/{total}")
 
-      segment_group_string = match.group()
+def split_segment_elements(segment_string: str) -> list:
+  """Splits a segment, written with the default control characters, into its elements (segment tag excluded).
+  Composite elements are lists of components, released characters are unescaped."""
 
-      last_segment = find_last_segment(segment_group_string)#.replace("+", "\+").replace(".", "\.")
-      print(f"BEFORE ESCAPE {last_segment=}")
+  service_string = DEFAULT_SERVICE_STRING
+  segment = segment_string.strip()
 
-      last_segment = escape_regex_chars(last_segment)
-      print(f"AFTER ESCAPE {last_segment=}")
+  if service_string.release_character not in segment:
+    if segment.endswith(service_string.segment_terminator):
+      segment = segment[:-1]
 
-      complementary_match = re.compile(f"{segment_pattern}.*?'", re.DOTALL).search(segment_group_string)
-      if complementary_match:
-        segment_pattern_full = escape_regex_chars(complementary_match.group())
-      else:
-        segment_pattern_full = segment_pattern
+    elements = segment.split(service_string.data_separator)[1:]
 
-      segment_group_regex = f'{segment_pattern_full}.*?{last_segment}'
+    return [
+      compact_components(element.split(service_string.component_separator)) if service_string.component_separator in element else element
+      for element in elements
+    ]
 
-      segment_group_found = re.compile(segment_group_regex, re.DOTALL).findall(segment_group_string)
+  elements = []
+  components = []
+  component = []
+  released = False
 
-      print(f"SEGMENT GROUP REGEX {index} : ", segment_group_regex)
-      print(f"LAST SEGMENT IN {field.name} GROUP {index}: {last_segment}")
-      print(f"SEGMENT GROUP STRING {index} : ", segment_group_string.replace('\n', ''))
-      print(f"SEGMENT GROUP FOUND {index} : ", segment_group_found)
-      print()
+  for char in segment:
+    if released:
+      component.append(char)
+      released = False
+    elif char == service_string.release_character:
+      released = True
+    elif char == service_string.data_separator:
+      components.append("".join(component))
+      elements.append(components)
+      components, component = [], []
+    elif char == service_string.component_separator:
+      components.append("".join(component))
+      component = []
+    elif char == service_string.segment_terminator:
+      break
+    else:
+      component.append(char)
 
-      segment_groups.append(segment_group_found)
+  components.append("".join(component))
+  elements.append(components)
 
-  return segment_groups
+  return [compact_components(components) for components in elements[1:]]
 
 
-def parse_segment(regex_pattern: str, segments_string: str) -> list:
+def decode_float(value: str):
+  """Decodes a numeric element value, with either '.' or ',' as decimal mark.
+  Empty values are decoded to None, values which are not numbers are kept as is."""
 
-  segments = re.compile(pattern=regex_pattern, flags=re.DOTALL).findall(segments_string)
+  if value == "":
+    return None
 
-  segments_collection = [RawSegmentCollection.from_str(segment).segments for segment in segments]
+  try:
+    return float(value.replace(",", "."))
+  except ValueError:
+    return value
 
-  elements_collection = [segments[0].elements for segments in segments_collection]
 
-  return elements_collection
+def decode_int(value: str):
+  """Decodes an integer element value. Empty values are decoded to None, values which are not integers are kept as is."""
+
+  if value == "":
+    return None
+
+  try:
+    return int(value)
+  except ValueError:
+    number = decode_float(value)
+    return int(number) if isinstance(number, float) and number.is_integer() else value
+
+
+# Decoders of element values by field annotation, see get_field_decoder
+VALUE_DECODERS = {
+  float: decode_float,
+  int: decode_int,
+}
+
+# String fields with these name suffixes hold codes from short code lists ("KGM", "CN", "306"...), their values are interned
+INTERNED_FIELDS_SUFFIXES = ("_code", "_qualifier")
+
+
+def get_field_decoder(field: Field):
+  """Returns the decoder of a field values: the 'decoder' field metadata if given (None keeps the raw strings),
+  else the decoder of its annotated type. Code string fields are interned, so that all the segments share one
+  string per code value: fields named with an INTERNED_FIELDS_SUFFIXES suffix, or with an 'intern' metadata set to True."""
+
+  if "decoder" in field.metadata:
+    return field.metadata["decoder"]
+
+  if field.type is str and field.metadata.get("intern", field.name.endswith(INTERNED_FIELDS_SUFFIXES)):
+    return sys.intern
+
+  return VALUE_DECODERS.get(field.type)
+
+
+def get_segments_elements(segments_string: str) -> list:
+  """Returns the elements of each segment of segments_string, split with the selected element splitter."""
+
+  if element_splitter == "native":
+    return [split_segment_elements(segment) for segment in split_segments(segments_string)]
+
+  pydifact_elements = [segment.elements for segment in RawSegmentCollection.from_str(segments_string).segments]
+
+  if element_splitter == "verify":
+    native_elements = [split_segment_elements(segment) for segment in split_segments(segments_string)]
+    if native_elements != pydifact_elements:
+      logger.warning("ELEMENT SPLITTERS MISMATCH for segments_string=%r native_elements=%r pydifact_elements=%r", segments_string, native_elements, pydifact_elements)
+
+  return pydifact_elements
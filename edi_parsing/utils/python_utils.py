@@ -1,9 +1,8 @@
 import os
-import json
 
-from functools import wraps
-from typing import get_args
-from dataclasses import asdict
+from typing import get_args, Iterable
+
+from utils import serialization_utils
 
 
 def get_subtype(field):
@@ -14,35 +13,33 @@ def get_subtype(field):
 
 
 
-def write_json(data, filename):
+def write_json(data, filename, compact: bool = False, backend: str = "json"):
+  """Writes data to filename, indented or compact, with the standard json module or orjson (see serialization_utils.JSON_BACKENDS)."""
   directory = os.path.dirname(filename)
   if not os.path.exists(directory):
     os.makedirs(directory)
 
-  with open(filename, "w+") as outfile:
-    json.dump(data, outfile, indent=2)
+  with open(filename, "wb") as outfile:
+    serialization_utils.dump_json(data, outfile, compact=compact, backend=backend)
 
 
 
-def as_dict(dataclass_list: list):
-  return [asdict(d) for d in dataclass_list]
+def write_json_stream(dataclass_iterable: Iterable, filename, json_lines: bool = False, compact: bool = False, backend: str = "json", raw_text: str = "include", skip_defaults: bool = False) -> int:
+  """Converts (see as_dict) and writes the dataclasses to filename as they are yielded, as a JSON array or JSON lines
+  (see serialization_utils.JsonStreamWriter). Returns the number of dataclasses written."""
+  directory = os.path.dirname(filename)
+  if not os.path.exists(directory):
+    os.makedirs(directory)
 
+  with serialization_utils.JsonStreamWriter(filename, json_lines=json_lines, compact=compact, backend=backend) as writer:
+    for d in dataclass_iterable:
+      writer.write(serialization_utils.get_encoder(type(d), raw_text, skip_defaults)(d))
 
-def progress(list_values):
-  
-  def inner(function):
-    total = len(list_values)
-    @wraps(function)
-    def wrapper(*args, **kwargs):
+  return writer.count
 
-      index = list_values.index(args[0])
-      progress_percent = (index+1)/total*100
-      element_string_ratio = f"{index+1}/{total}"
 
-      print(f"{'':#<15} Progress : {progress_percent:.2f}% - processing element {element_string_ratio} {'':#>15}")
 
-      return function(*args, **kwargs)
-      
-    return wrapper
-  
-  return inner
\ No newline at end of file
+def as_dict(dataclass_list: list, raw_text: str = "include", skip_defaults: bool = False):
+  """Converts dataclasses to dictionaries with the generated encoders of their classes (see serialization_utils.get_encoder).
+  RawText values are exported with raw_text (see RAW_TEXT_MODES), with skip_defaults fields equal to their default are left out."""
+  return [serialization_utils.get_encoder(type(d), raw_text, skip_defaults)(d) for d in dataclass_list]
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+
+from typing import Union
+
+from utils import parsing_utils
+from utils import cache_utils
+
+
+logger = logging.getLogger(__name__)
+
+REVISION_STATE_VERSION = 1
+
+
+
+def hash_segment_group(segment_group: Union[str, parsing_utils.RawText]) -> bytes:
+  """Returns the 16 bytes blake2b digest of a segments group text."""
+
+  return hashlib.blake2b(str(segment_group).encode("utf-8"), digest_size=16).digest()
+
+
+
+def get_segment_group_key(segment_group: Union[str, parsing_utils.RawText]) -> str:
+  """Returns the key of a segments group in the delta between revisions: the location identification of its main LOC segment
+  (its slot, or tank for tank groups) followed by the equipment identifier of its first EQD segment if any,
+  e.g. 0010082/MSCU1234567 for LOC+147+0010082::5'EQD+CN+MSCU1234567...' (slots may be missing or anonymized)."""
+
+  service_string = parsing_utils.DEFAULT_SERVICE_STRING
+  segments = str(segment_group).split(service_string.segment_terminator)
+  key = get_element(segments[0], 2).split(service_string.component_separator)[0]
+
+  equipment = next((get_element(segment, 2) for segment in segments if segment.startswith("EQD")), None)
+  if equipment is not None:
+    key = f"{key}/{equipment.split(service_string.component_separator)[0]}"
+
+  return key
+
+
+
+def get_element(segment: str, index: int) -> str:
+  elements = segment.split(parsing_utils.DEFAULT_SERVICE_STRING.data_separator)
+  return elements[index] if len(elements) > index else ""
+
+
+
+class RevisionTracker:
+  """Tracks the segments groups of a revision of an EDI file against the state of the previous revision
+  (see get_state): segments groups whose text is unchanged are reused from the previous revision instead of being parsed,
+  and the delta between revisions is reported by slot (see get_delta).
+
+  Parsed segments groups are only reused when parse_key (parser fingerprint and parse options) is the one of the previous
+  revision, the delta does not depend on it."""
+
+  def __init__(self, previous_state: dict = None, parse_key: str = None):
+    previous_state = previous_state if previous_state and previous_state.get("version") == REVISION_STATE_VERSION else {}
+
+    self.parse_key = parse_key
+    self.previous_slots = previous_state.get("slots", {})
+    self.previous_groups = dict(previous_state.get("groups", {})) if previous_state.get("parse_key") == parse_key else {}
+    self.slots = {}
+    self.groups = {}
+
+  def lookup(self, segment_group: Union[str, parsing_utils.RawText]):
+    """Returns (hash, previously parsed segment group or None) of a segments group, recording its slot.
+    Each previously parsed segment group is reused once, so identical segments groups each get their own."""
+
+    group_hash = hash_segment_group(segment_group)
+    slot = get_segment_group_key(segment_group)
+
+    # Keys appearing several times (e.g. anonymized slots of empty equipments) are numbered
+    key, occurrence = slot, 1
+    while key in self.slots:
+      occurrence += 1
+      key = f"{slot}#{occurrence}"
+    self.slots[key] = group_hash
+
+    return group_hash, self.previous_groups.pop(group_hash, None)
+
+  def add(self, group_hash: bytes, parsed_segment_group):
+    self.groups[group_hash] = parsed_segment_group
+
+  def get_delta(self) -> dict:
+    """Returns the added, removed and changed slots since the previous revision, and the number of unchanged ones."""
+
+    added = [slot for slot in self.slots if slot not in self.previous_slots]
+    removed = [slot for slot in self.previous_slots if slot not in self.slots]
+    changed = [slot for slot, group_hash in self.slots.items() if slot in self.previous_slots and self.previous_slots[slot] != group_hash]
+
+    return {
+      "added": added,
+      "removed": removed,
+      "changed": changed,
+      "unchanged_count": len(self.slots) - len(added) - len(changed),
+    }
+
+  def get_state(self) -> dict:
+    return {
+      "version": REVISION_STATE_VERSION,
+      "parse_key": self.parse_key,
+      "slots": self.slots,
+      "groups": self.groups,
+    }
+
+
+
+def load_revision_state(path: str) -> dict:
+  """Returns the revision state saved at path, or None (first revision, or unreadable state)."""
+
+  return cache_utils.read_entry(path)
+
+
+
+def save_revision_state(path: str, state: dict):
+  cache_utils.write_entry(path, state)
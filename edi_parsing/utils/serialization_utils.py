@@ -0,0 +1,197 @@
+import os
+import json
+
+from typing import get_args
+from dataclasses import fields, is_dataclass, MISSING
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+from utils.parsing_utils import RawText
+
+
+JSON_BACKENDS = ("auto", "json", "orjson")
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# Bytes buffered by JsonStreamWriter before they are written to the file
+DEFAULT_STREAM_BUFFER_SIZE = 1 << 20
+
+# Generated encoders by (dataclass, raw_text, skip_defaults), see get_encoder
+encoders = {}
+
+
+
+def encode_value(value, raw_text: str = "include", skip_defaults: bool = False):
+  """Encodes a value whose type is not known from the annotations (e.g. a composite element parsed into a string field)."""
+
+  if is_dataclass(value) and not isinstance(value, type):
+    return get_encoder(type(value), raw_text, skip_defaults)(value)
+  if isinstance(value, RawText):
+    return value.export(raw_text)
+  if isinstance(value, (list, tuple)):
+    return type(value)(encode_value(item, raw_text, skip_defaults) for item in value)
+  if isinstance(value, dict):
+    return {key: encode_value(item, raw_text, skip_defaults) for key, item in value.items()}
+  return value
+
+
+
+def get_field_default(field):
+  """Returns (True, default value) of a field, or (False, None) if its default cannot be built (e.g. it has required fields)."""
+
+  if field.default is not MISSING:
+    return True, field.default
+
+  if field.default_factory is MISSING:
+    return False, None
+
+  try:
+    return True, field.default_factory.empty() if hasattr(field.default_factory, "empty") else field.default_factory()
+  except TypeError:
+    return False, None
+
+
+
+def build_encoder(cls: type, raw_text: str = "include", skip_defaults: bool = False):
+  """Generates the to-dict encoder of a dataclass: a function reading each field and encoding it according to its annotation,
+  so that asdict's generic recursion and deep copies are done once here instead of on every object.
+
+  Nested dataclasses use their own generated encoder. RawText fields are exported with raw_text (see RAW_TEXT_MODES),
+  with skip_defaults the fields equal to their default value are left out."""
+
+  namespace = {
+    "encode_value": encode_value,
+    "SCALAR_TYPES": SCALAR_TYPES,
+    "raw_text": raw_text,
+    "skip_defaults": skip_defaults,
+  }
+  lines = [f"def encode_{cls.__name__}(obj):", "  d = {}"]
+
+  for index, field in enumerate(fields(cls)):
+    field_type = field.type
+    subtype = get_args(field_type)[0] if len(get_args(field_type)) == 1 else None
+
+    if field_type is RawText:
+      if raw_text == "omit":
+        continue
+      expression = "v.text" if raw_text == "include" else "v.export(raw_text)"
+    elif is_dataclass(field_type):
+      namespace[f"encode_{index}"] = get_encoder(field_type, raw_text, skip_defaults)
+      expression = f"None if v is None else encode_{index}(v)"
+    elif subtype is not None and is_dataclass(subtype):
+      namespace[f"encode_{index}"] = get_encoder(subtype, raw_text, skip_defaults)
+      expression = f"[encode_{index}(item) for item in v]"
+    elif field_type in SCALAR_TYPES:
+      expression = "v if v.__class__ in SCALAR_TYPES else encode_value(v, raw_text, skip_defaults)"
+    else:
+      expression = "encode_value(v, raw_text, skip_defaults)"
+
+    lines.append(f"  v = obj.{field.name}")
+
+    has_default, default = get_field_default(field) if skip_defaults else (False, None)
+
+    if has_default:
+      namespace[f"default_{index}"] = default
+      lines.append(f"  if v is not default_{index} and v != default_{index}:")
+      lines.append(f"    d[{field.name!r}] = {expression}")
+    else:
+      lines.append(f"  d[{field.name!r}] = {expression}")
+
+  lines.append("  return d")
+
+  exec("\n".join(lines), namespace)
+
+  return namespace[f"encode_{cls.__name__}"]
+
+
+
+def get_encoder(cls: type, raw_text: str = "include", skip_defaults: bool = False):
+  """Returns the generated to-dict encoder of a dataclass, built once per class and options."""
+
+  key = (cls, raw_text, skip_defaults)
+  encoder = encoders.get(key)
+
+  if encoder is None:
+    encoder = build_encoder(cls, raw_text, skip_defaults)
+    encoders[key] = encoder
+
+  return encoder
+
+
+
+def get_json_backend(backend: str = "json") -> str:
+  """Resolves the JSON backend: orjson if installed for "auto", the standard json module otherwise.
+  The standard json module is the default: orjson writes non-ASCII characters as is instead of escaped, and NaN values as null."""
+
+  if backend == "auto":
+    return "orjson" if orjson is not None else "json"
+
+  if backend == "orjson" and orjson is None:
+    raise ImportError("orjson JSON backend requested but orjson is not installed (pip install orjson)")
+
+  return backend
+
+
+
+def dumps_json(data, compact: bool = False, backend: str = "json") -> bytes:
+  """Returns data as JSON bytes, indented by 2 spaces or compact (no indentation nor spaces)."""
+
+  if get_json_backend(backend) == "orjson":
+    return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+
+  return json.dumps(data, indent=None if compact else 2, separators=(",", ":") if compact else None).encode("utf-8")
+
+
+
+def dump_json(data, outfile, compact: bool = False, backend: str = "json"):
+  """Writes data as JSON to a binary file, indented by 2 spaces or compact (no indentation nor spaces)."""
+
+  outfile.write(dumps_json(data, compact, backend))
+
+
+
+class JsonStreamWriter:
+  """Writes items one by one to a JSON array file (the same bytes as dump_json of the whole list) or to a JSON lines file
+  (one compact item per line), so that the file is written while the items are produced instead of once they all are.
+
+  At most buffer_size bytes are buffered before being written. Closing the writer ends the array, then flushes and fsyncs
+  the file. If the writer is left on an exception, the file is closed as is (an unterminated array)."""
+
+  def __init__(self, filename: str, json_lines: bool = False, compact: bool = False, backend: str = "json", buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE):
+    self.json_lines = json_lines
+    self.compact = compact or json_lines
+    self.backend = get_json_backend(backend)
+    self.count = 0
+    self.file = open(filename, "wb", buffering=buffer_size)
+
+  def write(self, data):
+    item = dumps_json(data, self.compact, self.backend)
+
+    if self.json_lines:
+      self.file.write(item + b"\n")
+    elif self.compact:
+      self.file.write((b"," if self.count else b"[") + item)
+    else:
+      self.file.write((b",\n  " if self.count else b"[\n  ") + item.replace(b"\n", b"\n  "))
+
+    self.count += 1
+
+  def close(self, complete: bool = True):
+    if self.file.closed:
+      return
+
+    if complete and not self.json_lines:
+      self.file.write(b"[]" if not self.count else b"]" if self.compact else b"\n]")
+
+    self.file.flush()
+    os.fsync(self.file.fileno())
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close(complete=exc_type is None)
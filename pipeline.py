@@ -0,0 +1,181 @@
+import os
+import sys
+import glob
+import logging
+import argparse
+import importlib
+
+import pandas as pd
+
+
+PARENT_DIR = os.path.dirname(os.path.abspath(__file__))
+EDI_PARSING_DIR = os.path.join(PARENT_DIR, "edi_parsing")
+PREPROCESSING_CONTAINERS_DIR = os.path.join(PARENT_DIR, "preprocessing_containers")
+
+INPUT_TYPES = ("OnBoard", "LoadList")
+HANDOFFS = ("auto", "tables", "segments_groups")
+
+
+def import_modules(directory, *module_names):
+    """Imports modules of edi_parsing or preprocessing_containers, which both import their helpers as the top-level utils package:
+    the utils modules imported from the other directory are unloaded first (the modules already imported keep theirs)."""
+    for module_name in [module_name for module_name in sys.modules if module_name == "utils" or module_name.startswith("utils.")]:
+        del sys.modules[module_name]
+
+    sys.path.insert(0, directory)
+    try:
+        return [importlib.import_module(module_name) for module_name in module_names]
+    finally:
+        sys.path.remove(directory)
+
+
+# edi_parsing is imported last, so that the utils modules of the parsed segments groups sent back by parsing workers are its own
+runner, = import_modules(PREPROCESSING_CONTAINERS_DIR, "runner")
+parsing_utils, python_utils, metrics_utils, logging_utils, arrow_utils, cache_utils, revision_utils, baplie_parsers, baplie_segments_groups = import_modules(
+    EDI_PARSING_DIR,
+    "utils.parsing_utils",
+    "utils.python_utils",
+    "utils.metrics_utils",
+    "utils.logging_utils",
+    "utils.arrow_utils",
+    "utils.cache_utils",
+    "utils.revision_utils",
+    "data_model.baplie_parsers",
+    "data_model.baplie_segments_groups",
+)
+
+parser = argparse.ArgumentParser(description="Builds containers.csv from the .edi files of a simulation in one process: the parsed segments groups are handed to the containers rules in memory, without the output_data JSON files")
+parser.add_argument("--simulation", "-s", type=str, default='164', help="Simulation number")
+parser.add_argument("--env", "-e", type=str, default="prod", help="Environment (prod or dev)")
+parser.add_argument("--workers", "-w", type=int, default=1, help="Number of processes parsing the segments groups (1 parses them in the main process)")
+parser.add_argument("--chunk-size", type=int, default=baplie_parsers.DEFAULT_PARSE_CHUNK_SIZE, help="Number of segments groups sent at once to a parsing process")
+parser.add_argument("--raw-text", type=str, default="omit", choices=list(runner.RAW_TEXT_COLUMNS), help="Write the raw EDI text of each container location to containers.csv as text, as start and end offsets in the .edi file, or not at all")
+parser.add_argument("--handoff", type=str, default="auto", choices=HANDOFFS, help="How the parsed segments groups are handed to the containers rules: as tables of the used columns (requires pyarrow, used by auto when it is installed), or as segments groups dicts flattened like the JSON files")
+parser.add_argument("--full-parse", action="store_true", help="Parse all the fields of the segments groups, not only the ones containers.csv is built from")
+parser.add_argument("--debug-json", action="store_true", help="Also write the parsed segments groups to output_data as edi_parsing/main.py does (OnBoard.json, LoadList.json)")
+parser.add_argument("--progress", type=str, default="bar", choices=list(metrics_utils.PROGRESS_SINKS), help="How the parsing progress and throughput are reported on stderr: a progress bar, JSON lines or nothing")
+parser.add_argument("--log-level", type=str, default="INFO", choices=logging_utils.LOG_LEVELS, help="Log level of all modules")
+parser.add_argument("--log-module", type=str, action="append", default=[], help="Log level of one module, as module=LEVEL (e.g. runner=WARNING). Can be repeated")
+
+logger = logging.getLogger("pipeline")
+
+
+def get_file_signature(file_path):
+    """Returns the (modification time, size) of a file, None if it does not exist."""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def parse_input_type(simulation, env, input_type, projection=None, workers=1, chunk_size=baplie_parsers.DEFAULT_PARSE_CHUNK_SIZE, progress="bar", revision=None):
+    """Parses the .edi file of an input type of a simulation, returns its parsed segments groups.
+    With a revision (see revision_utils.RevisionTracker), the segments groups unchanged since the previous revision are reused."""
+    input_dir = os.path.join(PARENT_DIR, "data", "simulations", f"simulation_{simulation}_{env}", "in")
+    edi_files_paths = sorted(glob.glob(os.path.join(input_dir, f"*/{input_type}.edi")))
+
+    if not edi_files_paths:
+        raise FileNotFoundError(f"No {input_type}.edi file in {input_dir}")
+
+    edi_file_path = edi_files_paths[0]
+
+    logger.info("Parse %s", edi_file_path)
+    segments_groups = parsing_utils.read_edi_segments(edi_file_path=edi_file_path, segments_pattern=parsing_utils.LOCATION_SEGMENTS_PATTERN, stream=True)
+
+    metrics = metrics_utils.ParseMetrics(sinks=metrics_utils.get_progress_sinks(progress), total_bytes=os.path.getsize(edi_file_path))
+    with metrics:
+        return list(baplie_segments_groups.LocationSegmentGroup.iter_parse_segments_groups(segments_groups, workers=workers, chunk_size=chunk_size, metrics=metrics, projection=projection, revision=revision))
+
+
+def run_pipeline(simulation, env, raw_text="omit", handoff="auto", full_parse=False, debug_json=False, workers=1, chunk_size=baplie_parsers.DEFAULT_PARSE_CHUNK_SIZE, progress="bar", state=None):
+    """Parses the OnBoard and LoadList .edi files of a simulation, builds their containers data with preprocessing_containers/runner.py
+    and writes containers.csv, returns the containers dataframe.
+
+    state, if given, is a dict kept by the caller between runs of the same simulation (see watch.py): the segments groups unchanged
+    since the previous run are reused instead of parsed, and the containers data of an input type whose segments groups
+    and rotation.csv are unchanged is reused instead of rebuilt."""
+    if handoff == "auto":
+        handoff = "tables" if arrow_utils.pa is not None else "segments_groups"
+
+    # Only the fields of the containers.csv columns are parsed, see SegmentGroupParser.build_projection
+    projection_paths = [*runner.FINAL_COLUMNS, *(["edi_string"] if raw_text != "omit" else [])]
+    projection = None if full_parse else baplie_segments_groups.LocationSegmentGroup.build_projection(projection_paths)
+
+    output_dir = os.path.join(PARENT_DIR, "output_data", f"simulation_{simulation}_{env}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    rotation_path = os.path.join(PARENT_DIR, "data", "simulations", f"simulation_{simulation}_{env}", "in", "rotation.csv")
+    parse_key = cache_utils.get_parse_key(baplie_segments_groups.LocationSegmentGroup, projection=projection) if state is not None else None
+
+    dfs_containers = []
+
+    for input_type in INPUT_TYPES:
+        input_state = state.setdefault(input_type, {}) if state is not None else None
+        revision = revision_utils.RevisionTracker(input_state.get("revision"), parse_key) if input_state is not None else None
+
+        segments_groups = parse_input_type(simulation, env, input_type, projection, workers, chunk_size, progress, revision)
+
+        if revision is not None:
+            delta = revision.get_delta()
+            input_state["revision"] = revision.get_state()
+            logger.info(
+                "%s revision: %s added, %s removed, %s changed and %s unchanged segments groups",
+                input_type, len(delta["added"]), len(delta["removed"]), len(delta["changed"]), delta["unchanged_count"],
+            )
+
+            containers_key = (parse_key, raw_text, get_file_signature(rotation_path))
+            if not (delta["added"] or delta["removed"] or delta["changed"]) and input_state.get("containers_key") == containers_key:
+                logger.info("Reuse the %s containers data of the previous run", input_type)
+                dfs_containers.append(input_state["containers"])
+                continue
+
+        if debug_json:
+            python_utils.write_json_stream(segments_groups, os.path.join(output_dir, f"{input_type}.json"), raw_text=raw_text)
+
+        logger.info("Hand %s parsed %s segments groups to the containers rules as %s", len(segments_groups), input_type, handoff)
+        if handoff == "tables":
+            data = arrow_utils.build_segments_groups_tables(baplie_segments_groups.LocationSegmentGroup, segments_groups, raw_text=raw_text)
+        else:
+            data = python_utils.as_dict(segments_groups, raw_text=raw_text)
+
+        df_input_containers = runner.run(
+            simulation=simulation,
+            env=env,
+            parent_dir=PARENT_DIR,
+            input_type=input_type,
+            raw_text=raw_text,
+            data=data,
+        )
+        dfs_containers.append(df_input_containers)
+
+        if input_state is not None:
+            input_state.update(containers=df_input_containers, containers_key=containers_key)
+
+    df_containers = pd.concat(dfs_containers)
+
+    output_containers_path = os.path.join(output_dir, "containers.csv")
+    logger.info("Write %s containers to %s", len(df_containers), output_containers_path)
+    df_containers.to_csv(output_containers_path, index=False, sep=";")
+
+    return df_containers
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    logging_utils.configure_logging(args.log_level, logging_utils.parse_module_levels(args.log_module))
+
+    run_pipeline(
+        simulation=args.simulation,
+        env=args.env,
+        raw_text=args.raw_text,
+        handoff=args.handoff,
+        full_parse=args.full_parse,
+        debug_json=args.debug_json,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        progress=args.progress,
+    )
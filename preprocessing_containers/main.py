@@ -1,15 +1,24 @@
 import os
+import logging
 import argparse
-from runner import run
+from runner import run, INPUT_FORMATS, RAW_TEXT_COLUMNS
+from utils import logging_utils
 import pandas as pd
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("--simulation", "-s", type=str, default='164', help="Simulation number")
 parser.add_argument("--env", "-e", type=str, default="prod", help="Environment (prod or dev)")
+parser.add_argument("--raw-text", type=str, default="omit", choices=list(RAW_TEXT_COLUMNS), help="Write the raw EDI text of each container location to containers.csv as text, as start and end offsets in the .edi file, or not at all")
+parser.add_argument("--input-format", type=str, default="json", choices=INPUT_FORMATS, help="Format written by edi_parsing/main.py --output-format: a JSON array or JSON lines file, or a directory of Parquet or Arrow tables of which only the used columns are read")
+parser.add_argument("--log-level", type=str, default="INFO", choices=logging_utils.LOG_LEVELS, help="Log level of all modules")
+parser.add_argument("--log-module", type=str, action="append", default=[], help="Log level of one module, as module=LEVEL (e.g. runner=WARNING). Can be repeated")
 
 args = parser.parse_args()
 
+logging_utils.configure_logging(args.log_level, logging_utils.parse_module_levels(args.log_module))
+logger = logging.getLogger("main")
+
 simulation = args.simulation
 env = args.env
 
@@ -19,7 +28,7 @@ class InputType:
     Tank = "Tank"
 
 
-print("Define base directory and parent directory")
+logger.info("Define base directory and parent directory")
 base_dir = os.path.dirname(__file__)
 parent_dir = os.path.dirname(base_dir)
 
@@ -29,6 +38,8 @@ df_onboard = run(
     env = env,
     parent_dir = parent_dir,
     input_type = InputType.OnBoard,
+    raw_text = args.raw_text,
+    input_format = args.input_format,
 )
 
 df_loadlist = run(
@@ -36,6 +47,8 @@ df_loadlist = run(
     env = env,
     parent_dir = parent_dir,
     input_type = InputType.LoadList,
+    raw_text = args.raw_text,
+    input_format = args.input_format,
 )
 
 df_containers = pd.concat([df_onboard, df_loadlist])
@@ -1,6 +1,7 @@
 import os
 import json
 import glob
+import logging
 
 import numpy as np
 import pandas as pd
@@ -9,75 +10,16 @@ from pandas import json_normalize
 
 from computation_rules import functional_rules, legacy_rules
 
-from utils import pandas_utils, preprocessing_utils, referential_utils
+from utils import arrow_utils, pandas_utils, preprocessing_utils, referential_utils
 
-def run(
-    simulation,
-    env,
-    parent_dir,
-    input_type,
-):
-    print(f"Running containers.csv generation for simulation {simulation} in environment {env} and input type {input_type}...")
-    
-    print("Define input and output directory")
-    input_dir = os.path.join(
-        parent_dir,
-        "output_data",
-        f"simulation_{simulation}_{env}",
-    )
-
-    print("Define referential directory")
-    referential_dir = os.path.join(
-        parent_dir,
-        "data",
-        "referential",
-    )
-
-    print("Define referential stacks directory")
-    referential_stacks_path = os.path.join(
-        referential_dir,
-        "vessels",
-        "9454448",
-        "Stacks Extrait Prototype MP_IN.csv"
-    )
-
-    print("Define referential hz_imdg_exis_subs directory")
-    referential_hz_imdg_exis_subs_path = os.path.join(
-        referential_dir,
-        "hz_imdg_exis_subs.csv"
-    )
 
-    print("Define rotation directory")
-    input_rotation_path = os.path.join(
-        parent_dir,
-        "data",
-        "simulations",
-        f"simulation_{simulation}_{env}",
-        "in",
-        "rotation.csv"
-    )
-
-    print("Define input data path")
-    input_json_file = os.path.join(input_dir, f"{input_type}.json")
-    print(input_json_file)
-    input_data_path = glob.glob(input_json_file)
-    input_data_path = input_data_path[0]
-
-
-    print("Read input data")
-    with open(input_data_path, "r") as f:
-        data = json.load(f)
+logger = logging.getLogger(__name__)
 
-    print("Normalize input data")
-    df = json_normalize(data)
 
-    print("Flatten input data")
-    df_flatten = pandas_utils.recurive_flatten_and_explode(df)
+INPUT_FORMATS = ("json", "ndjson", *arrow_utils.TABLES_FORMATS)
 
-    print(df_flatten.head())
-
-    print("Define final columns")
-    final_columns = {
+# Columns of the flattened segments groups (dotted fields paths, also usable as an edi_parsing/main.py --projection) and their containers.csv names
+FINAL_COLUMNS = {
     'EQD_CN.EQD.equipment_identification.equipment_identifier': "Container",
     'LOC_147.location_identification.location_identifier': "Slot",
     'EQD_CN.EQD.equipment_size_and_type.equipment_size_and_type_description_code': "Type",
@@ -125,78 +67,217 @@ def run(
     'EQD_CN.DGS.ATT.attribute_details.attribute_description': "dg_proper_shipping_name",
 
 
-    "edi_string": "edi_string",
-
     'EQD_CN.DIM_1_BREAKBULK_HEIGHT_MEASURE.dimension_specification.height_measure': "BREAKBULK_MEASURE_value",
     'EQD_CN.DIM_1_BREAKBULK_HEIGHT_MEASURE.dimension_specification.measurement_unit_code': "BREAKBULK_MEASURE_unit_code",
 
     'EQD_CN.DIM_19_COLLAPSED_FLAT_RACK_HEIGHT_MEASURE.dimension_specification.height_measure': "COLLAPSED_FLAT_RACK_MEASURE_value",
     'EQD_CN.DIM_19_COLLAPSED_FLAT_RACK_HEIGHT_MEASURE.dimension_specification.measurement_unit_code': "COLLAPSED_FLAT_RACK_MEASURE_unit_code",
+}
+
+# Columns of the raw EDI text of each location, by raw_text mode (the mode used by edi_parsing/main.py --raw-text to write the JSON)
+RAW_TEXT_COLUMNS = {
+    "include": {"edi_string": "edi_string"},
+    "offsets": {"edi_string.start": "edi_string_start", "edi_string.end": "edi_string_end"},
+    "omit": {},
+}
+
+RAW_TEXT_SCHEMA = {
+    "edi_string": {"type": str, "fillna": ""},
+    "edi_string_start": {"type": int, "fillna": -1},
+    "edi_string_end": {"type": int, "fillna": -1},
+}
+
+# Referential data by parent directory, read once per process (see load_referentials)
+referentials = {}
+
+
+def load_referentials(parent_dir):
+    """Returns the referential data of parent_dir/data/referential: the preprocessed vessel stacks, and the DG stowage codes
+    of the IMDG substances. They are read on the first call only, later runs of the same process reuse them (they are not modified)."""
+    if parent_dir in referentials:
+        return referentials[parent_dir]
+
+    logger.info("Define referential directory")
+    referential_dir = os.path.join(
+        parent_dir,
+        "data",
+        "referential",
+    )
+
+    logger.info("Define referential stacks directory")
+    referential_stacks_path = os.path.join(
+        referential_dir,
+        "vessels",
+        "9454448",
+        "Stacks Extrait Prototype MP_IN.csv"
+    )
+
+    logger.info("Define referential hz_imdg_exis_subs directory")
+    referential_hz_imdg_exis_subs_path = os.path.join(
+        referential_dir,
+        "hz_imdg_exis_subs.csv"
+    )
+
+    logger.info("Read referential stacks data")
+    df_stacks = pd.read_csv(referential_stacks_path, sep=";", header=0, dtype=str)
+    df_stacks = preprocessing_utils.preprocessess_stack_data(df_stacks, ["MacroBay", "Row", "MacroTier"])
+
+
+    logger.info("Read referential hz_imdg_exis_subs data")
+    df_hz_imdg_exis_subs = pd.read_csv(referential_hz_imdg_exis_subs_path, sep=",", header=0, dtype=str)
+
+    referentials[parent_dir] = {
+        "stacks": df_stacks,
+        "dg_stowage_codes": functional_rules.get_dg_stowage_codes(df_hz_imdg_exis_subs),
     }
 
+    return referentials[parent_dir]
+
+
+def run(
+    simulation,
+    env,
+    parent_dir,
+    input_type,
+    raw_text="omit",
+    input_format="json",
+    data=None,
+):
+    """Builds the containers data of a simulation input type from the segments groups parsed by edi_parsing/main.py,
+    read from the output_data files of input_format. data, if given, holds the parsed segments groups in memory instead:
+    either a list of segments groups dicts (the JSON output), or a dict of pyarrow tables by name (the tables output),
+    built with the raw_text mode."""
+    logger.info("Running containers.csv generation for simulation %s in environment %s and input type %s...", simulation, env, input_type)
+    
+    logger.info("Define input and output directory")
+    input_dir = os.path.join(
+        parent_dir,
+        "output_data",
+        f"simulation_{simulation}_{env}",
+    )
+
+    logger.info("Define rotation directory")
+    input_rotation_path = os.path.join(
+        parent_dir,
+        "data",
+        "simulations",
+        f"simulation_{simulation}_{env}",
+        "in",
+        "rotation.csv"
+    )
+
+    logger.info("Define final columns")
+    final_columns = dict(FINAL_COLUMNS)
+
+    logger.info("Define raw EDI text columns for raw_text=%s", raw_text)
+    raw_text_columns = RAW_TEXT_COLUMNS[raw_text]
+    used_columns = [*final_columns, *raw_text_columns]
+
+    if isinstance(data, dict):
+        logger.info("Select the %s columns used from the %s in-memory tables", len(used_columns), len(data))
+        input_data_path = f"In-memory {input_type} tables"
+        df_flatten = arrow_utils.select_flat_columns(data, used_columns)
+    elif data is not None:
+        input_data_path = f"In-memory {input_type} segments groups"
+
+        logger.info("Normalize input data")
+        df = json_normalize(data)
+
+        logger.info("Flatten input data")
+        df_flatten = pandas_utils.recurive_flatten_and_explode(df)
+    elif input_format in ("json", "ndjson"):
+        logger.info("Define input data path")
+        input_json_file = os.path.join(input_dir, f"{input_type}.{input_format}")
+        logger.info("input_json_file=%s", input_json_file)
+        input_data_path = glob.glob(input_json_file)
+        input_data_path = input_data_path[0]
+
+
+        logger.info("Read input data")
+        with open(input_data_path, "r") as f:
+            data = json.load(f) if input_format == "json" else [json.loads(line) for line in f if line.strip()]
+
+        logger.info("Normalize input data")
+        df = json_normalize(data)
+
+        logger.info("Flatten input data")
+        df_flatten = pandas_utils.recurive_flatten_and_explode(df)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("df_flatten.head()=\n%s", df_flatten.head())
+    else:
+        logger.info("Read the %s columns used from the %s tables", len(used_columns), input_format)
+        input_data_path = os.path.join(input_dir, input_type)
+        logger.info("input_data_path=%s", input_data_path)
+        df_flatten = arrow_utils.read_flat_columns(input_data_path, used_columns, input_format)
+
+    missing_raw_text_columns = [column for column in raw_text_columns if column not in df_flatten.columns]
+
+    if missing_raw_text_columns:
+        raise ValueError(f"{input_data_path} has no {missing_raw_text_columns} columns, it must be generated with edi_parsing/main.py --raw-text {raw_text}")
+
+    final_columns.update(raw_text_columns)
+
     used_columns = list(final_columns.keys())
 
 
     # Flatten
-    print("Flatten input data")
-    df_flatten_renamed = df_flatten[used_columns].rename(columns=final_columns).query("Container.notnull()")
+    logger.info("Flatten input data")
+    # Columns can be missing when the JSON was written without default values (edi_parsing/main.py --skip-defaults)
+    df_flatten_renamed = df_flatten.reindex(columns=used_columns).rename(columns=final_columns).query("Container.notnull()")
 
 
     # Drop duplicates and replace empty strings and None with NaN
-    print("Drop duplicates and replace empty strings and None with NaN")
+    logger.info("Drop duplicates and replace empty strings and None with NaN")
     df_flatten_clean = df_flatten_renamed.drop_duplicates().copy()
     df_flatten_clean.replace("", np.nan, inplace=True)
     df_flatten_clean.replace([None], np.nan, inplace=True)
 
 
-    print("Read referential stacks data")
-    df_stacks = pd.read_csv(referential_stacks_path, sep=";", header=0, dtype=str)
-    df_stacks = preprocessing_utils.preprocessess_stack_data(df_stacks, ["MacroBay", "Row", "MacroTier"])
+    logger.info("Load referential data")
+    referential = load_referentials(parent_dir)
+    df_stacks = referential["stacks"]
 
 
-    print("Read referential hz_imdg_exis_subs data")
-    df_hz_imdg_exis_subs = pd.read_csv(referential_hz_imdg_exis_subs_path, sep=",", header=0, dtype=str)
-
-
-    print("Read rotation data")
+    logger.info("Read rotation data")
     df_rotation = pd.read_csv(input_rotation_path, sep=";", header=0, dtype=str).query("ShortName != 'MYPKG'")
 
 
-    print("Read containers data")
+    logger.info("Read containers data")
     df_containers = df_flatten_clean.reset_index(drop=True).copy()
 
-    print("Fill 'Slot' Column with leading zeros to have 7 characters")
+    logger.info("Fill 'Slot' Column with leading zeros to have 7 characters")
     # df_containers["Slot"] = df_containers["Slot"].str.zfill(7)
 
-    print("Compute functional column 'Size'")
+    logger.info("Compute functional column 'Size'")
     df_containers["Size"] = df_containers.apply(functional_rules.get_size, axis=1, size_referential=referential_utils.size_and_type_codes.SIZE_CODES_MAP, size_unit="ft", size_index=0)
 
 
-    print("Compute functional column 'Height'")
+    logger.info("Compute functional column 'Height'")
     df_containers["Height_ft"] = df_containers.apply(functional_rules.get_size, axis=1, size_referential=referential_utils.size_and_type_codes.HEIGHT_CODES_MAP, size_unit="ft", size_index=1)
     df_containers["Height_m"] = df_containers.apply(functional_rules.get_size, axis=1, size_referential=referential_utils.size_and_type_codes.HEIGHT_CODES_MAP, size_unit="m", size_index=1)
     df_containers["Height"] = df_containers["Height_ft"].apply(lambda x: "HC" if x > 8.6 else "")
 
 
-    print("Compute functional column 'cDG'")
+    logger.info("Compute functional column 'cDG'")
     df_containers["cDG"] = df_containers["dg_class"].apply(lambda x: x if pandas_utils.is_not_null(x) else "")
 
 
-    print("Compute functional column 'Stowage'")
+    logger.info("Compute functional column 'Stowage'")
     df_containers["Stowage"] = df_containers.apply(functional_rules.get_stowage_location, axis=1)
 
 
     # Set China port special case
-    print("Compute functional column 'Stowage' - Set China port special case")
+    logger.info("Compute functional column 'Stowage' - Set China port special case")
     df_containers.loc[(df_containers["cDG"] != "") & (df_containers["LoadPort"].str.startswith("CN")), "Stowage"] = "DECK"
 
 
-    print("Compute functional column 'dg_IMDG_AMENDMENT'")
-    dg_stowage_codes = functional_rules.get_dg_stowage_codes(df_hz_imdg_exis_subs)
+    logger.info("Compute functional column 'dg_IMDG_AMENDMENT'")
+    dg_stowage_codes = referential["dg_stowage_codes"]
     df_containers["dg_IMDG_AMENDMENT"] = df_containers["dg_version"].apply(lambda x: x.split("-")[0] if pandas_utils.is_not_null(x) else x)
 
 
-    print("Compute functional column 'DGheated'")
+    logger.info("Compute functional column 'DGheated'")
     df_containers_with_stowage_codes = (
     df_containers
         .merge(
@@ -209,31 +290,31 @@ def run(
     df_containers["DGheated"] = df_containers_with_stowage_codes.apply(functional_rules.get_dgheated, axis=1)
 
 
-    print("Compute functional column 'cType'")
+    logger.info("Compute functional column 'cType'")
     df_containers["cType"] = df_containers["temperature"].apply(lambda x: "RE" if pandas_utils.is_not_null(x) else "GP")
 
 
-    print("Compute functional column 'Empty'")
+    logger.info("Compute functional column 'Empty'")
     df_containers["Empty"] = df_containers["Empty"].apply(lambda x: "E" if str(x) == "4" else "")
 
 
-    print("Compute functional column 'Type'")
+    logger.info("Compute functional column 'Type'")
     df_containers["Setting"] = np.where(df_containers["cType"] == "RE", "R", df_containers["Empty"])
 
 
-    print("Compute functional column 'Weight'")
+    logger.info("Compute functional column 'Weight'")
     df_containers["Weight"] = preprocessing_utils.convert_measure_column(df_containers["Weight"], df_containers["Weight_unit_code"] , referential_utils.unit_codes.WEIGHT_UNIT_CODES_TNE).round(3)
 
 
-    print("Compute functional column 'cWeight'")
+    logger.info("Compute functional column 'cWeight'")
     df_containers[["Container", "Slot", "Type", "Size", "Height_ft", "Height_m", "Height", "Weight", "cDG"]]
 
 
-    print("Compute functional column 'cWeight'")
+    logger.info("Compute functional column 'cWeight'")
     df_containers["cWeight"] = df_containers["Weight"].apply(functional_rules.get_cweight)
 
 
-    print("Compute functional columns 'OOG_LEFT_MEASURE', 'OOG_RIGHT_MEASURE', 'OOG_TOP_MEASURE', 'OOG_FORWARD_MEASURE', 'OOG_AFTWARDS_MEASURE'")
+    logger.info("Compute functional columns 'OOG_LEFT_MEASURE', 'OOG_RIGHT_MEASURE', 'OOG_TOP_MEASURE', 'OOG_FORWARD_MEASURE', 'OOG_AFTWARDS_MEASURE'")
     df_containers["OOG_LEFT_MEASURE"] = preprocessing_utils.convert_measure_column(df_containers["OOG_LEFT_MEASURE_value"], df_containers["OOG_LEFT_MEASURE_unit_code"], referential_utils.unit_codes.LENGTH_UNIT_CODES_CM)
     df_containers["OOG_RIGHT_MEASURE"] = preprocessing_utils.convert_measure_column(df_containers["OOG_RIGHT_MEASURE_value"], df_containers["OOG_RIGHT_MEASURE_unit_code"], referential_utils.unit_codes.LENGTH_UNIT_CODES_CM)
     df_containers["OOG_TOP_MEASURE"] = preprocessing_utils.convert_measure_column(df_containers["OOG_TOP_MEASURE_value"], df_containers["OOG_TOP_MEASURE_unit_code"], referential_utils.unit_codes.LENGTH_UNIT_CODES, 2)
@@ -241,7 +322,7 @@ def run(
     df_containers["OOG_AFTWARDS_MEASURE"] = preprocessing_utils.convert_measure_column(df_containers["OOG_AFTWARDS_MEASURE_value"], df_containers["OOG_AFTWARDS_MEASURE_unit_code"], referential_utils.unit_codes.LENGTH_UNIT_CODES_CM)
 
 
-    print("Compute functional columns 'OOG_LEFT', 'OOG_RIGHT', 'OOG_TOP', 'OOG_FORWARD', 'OOG_AFTWARDS'")
+    logger.info("Compute functional columns 'OOG_LEFT', 'OOG_RIGHT', 'OOG_TOP', 'OOG_FORWARD', 'OOG_AFTWARDS'")
     df_containers["OOG_LEFT"] = df_containers["OOG_LEFT_MEASURE_value"].apply(lambda x: 1 if pandas_utils.is_not_null(x) else 0)
     df_containers["OOG_RIGHT"] = df_containers["OOG_RIGHT_MEASURE_value"].apply(lambda x: 1 if pandas_utils.is_not_null(x) else 0)
     df_containers["OOG_TOP"] = df_containers["OOG_TOP_MEASURE_value"].apply(lambda x: 1 if pandas_utils.is_not_null(x) else 0)
@@ -249,47 +330,47 @@ def run(
     df_containers["OOG_AFTWARDS"] = df_containers["OOG_AFTWARDS_MEASURE_value"].apply(lambda x: 1 if pandas_utils.is_not_null(x) else 0)
 
 
-    print("Compute functional columns 'POL_nb' and 'POD_nb' with Legacy Rule")
+    logger.info("Compute functional columns 'POL_nb' and 'POD_nb' with Legacy Rule")
     df_ports = legacy_rules.add_pol_pod_nb(df_containers, df_rotation)
     df_containers["POL_nb"] = df_ports["POL_nb"]
     df_containers["POD_nb"] = df_ports["POD_nb"]
 
 
-    print("Add stacks columns to df_containers")
+    logger.info("Add stacks columns to df_containers")
     df_containers = preprocessing_utils.add_stack_infos(df_containers, df_stacks)
 
 
-    print("Compute functional column 'NonReeferAtReefer'")
+    logger.info("Compute functional column 'NonReeferAtReefer'")
     df_containers["NonReeferAtReefer"] = df_containers.apply(functional_rules.get_non_reefer_at_reefer, axis=1)
 
 
-    print("Compute functional column 'overstowPort'")
+    logger.info("Compute functional column 'overstowPort'")
     df_containers = df_containers.sort_values(by=["MacroStack", "Tier", "MacroTier"], ascending=[True, False, False])
     df_containers["overstowPort"] = df_containers.apply(functional_rules.get_overstowPort, df=df_containers, axis=1)
 
 
 
-    print("Add 'is_onboard' tag")
+    logger.info("Add 'is_onboard' tag")
     df_containers["is_onboard"] = input_type == "OnBoard"
 
-    print("Handling ignored functional columns (not used for now) - setting to default constants :")
+    logger.info("Handling ignored functional columns (not used for now) - setting to default constants :")
 
-    print("Set Revenue functional column to 1")
+    logger.info("Set Revenue functional column to 1")
     df_containers["Revenue"] = 1 # As specified in JIRA
 
-    print("Set priorityID functional column to 1")
+    logger.info("Set priorityID functional column to 1")
     df_containers["priorityID"] = -1
 
-    print("Set priorityLevel functional column to -1")
+    logger.info("Set priorityLevel functional column to -1")
     df_containers["priorityLevel"] = -1
 
-    print("Set Subport functional column to empty string ''")
+    logger.info("Set Subport functional column to empty string ''")
     df_containers["Subport"] = ''
 
-    print("Set NonReeferAtReefer functional column to empty string ''")
+    logger.info("Set NonReeferAtReefer functional column to empty string ''")
     df_containers["Exclusion"] = ''
 
-    print("Define final containers data schema and types of each column")
+    logger.info("Define final containers data schema and types of each column")
     final_schema = {
         "Container": {"type": str, "fillna": ""},
         "LoadPort": {"type": str, "fillna": ""},
@@ -325,17 +406,19 @@ def run(
         "OOG_TOP_MEASURE": {"type": float, "fillna": 0.0},
     }
 
-    print("Define final containers data columns order")
+    final_schema.update({column: RAW_TEXT_SCHEMA[column] for column in raw_text_columns.values()})
+
+    logger.info("Define final containers data columns order")
     final_columns_order = list(final_schema.keys())
     final_schema_types = {k: v["type"] for k, v in final_schema.items()}
     final_schema_fillna_values = {k: v["fillna"] for k, v in final_schema.items()}
 
 
-    print("Reorder final containers data columns and convert each column to the final schema type")
+    logger.info("Reorder final containers data columns and convert each column to the final schema type")
     df_containers_with_column_order = df_containers[final_columns_order].fillna(value=final_schema_fillna_values).astype(final_schema_types)
 
     # Define aggregation functions for each column = priority rules in case of multiple values found (example multiple cDG => lowest class)
-    print("Define aggregation functions for each potentially duplicate column")
+    logger.info("Define aggregation functions for each potentially duplicate column")
     aggregation_functions = {
         'cDG': lambda x: x.min(),
         'overstowPort': lambda x: x.min(),
@@ -344,7 +427,7 @@ def run(
         # Add other columns and their aggregation functions as needed
     }
 
-    print("Aggregate duplicated lines with aggregation functions for potentially duplicate columns or default aggregation function for other duplicated column")
+    logger.info("Aggregate duplicated lines with aggregation functions for potentially duplicate columns or default aggregation function for other duplicated column")
     default_aggregation_function=lambda x: x.max()
     df_containers_final = preprocessing_utils.aggregate_duplicates(
         df_containers_with_column_order, 
@@ -352,7 +435,7 @@ def run(
         default_aggregation_function,
     )
 
-    print("Set output containers file path")
+    logger.info("Set output containers file path")
     output_containers_path = os.path.join(
         parent_dir,
         "output_data",
@@ -360,7 +443,7 @@ def run(
         f"containers_{simulation}_{input_type}.csv",
     )
 
-    print("Write output containers data")
+    logger.info("Write output containers data")
     df_containers_final.to_csv(output_containers_path, index=False, sep=";")
 
     return df_containers_final
\ No newline at end of file
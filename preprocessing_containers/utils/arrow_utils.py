@@ -0,0 +1,132 @@
+import os
+import logging
+
+import pandas as pd
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = pq = None
+
+
+logger = logging.getLogger(__name__)
+
+# Tables layout written by edi_parsing/utils/arrow_utils.py
+ROOT_TABLE = "groups"
+ID_COLUMN = "_id"
+PARENT_ID_COLUMN = "_parent_id"
+
+TABLES_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+
+def list_tables(directory: str, file_format: str = "parquet") -> list:
+  """Lists the tables of a directory written by edi_parsing/main.py --output-format parquet or arrow."""
+
+  extension = TABLES_FORMATS[file_format]
+
+  return sorted(file_name[:-len(extension)] for file_name in os.listdir(directory) if file_name.endswith(extension))
+
+
+
+def get_column_table(column: str, tables: list):
+  """Returns (table, column in table) of a dotted column such as EQD_CN.HAN.handling_instruction.handling_instruction_description_code,
+  i.e. the table whose name is the longest prefix of the column (the root table otherwise)."""
+
+  for table in sorted(tables, key=len, reverse=True):
+    if table != ROOT_TABLE and column.startswith(f"{table}."):
+      return table, column[len(table) + 1:]
+
+  return ROOT_TABLE, column
+
+
+
+def read_table(directory: str, table: str, columns: list, file_format: str = "parquet") -> pd.DataFrame:
+  """Reads only the given columns of a table (and its join keys)."""
+
+  path = os.path.join(directory, f"{table}{TABLES_FORMATS[file_format]}")
+  columns = [ID_COLUMN, PARENT_ID_COLUMN, *columns]
+
+  if file_format == "parquet":
+    arrow_table = pq.read_table(path, columns=columns)
+  else:
+    with pa.memory_map(path) as source:
+      arrow_table = pa.ipc.open_file(source).read_all().select(columns)
+
+  return arrow_table.to_pandas()
+
+
+
+def read_flat_columns(directory: str, columns: list, file_format: str = "parquet") -> pd.DataFrame:
+  """Reads dotted columns from a tables directory into one flat dataframe, like json_normalize and recurive_flatten_and_explode
+  on the JSON output: only the tables holding the columns (and their parents) are read, and each child table is left joined
+  on its parent rows. Columns missing from the tables are left out."""
+
+  if pa is None:
+    raise ImportError("parquet and arrow inputs require pyarrow (pip install pyarrow)")
+
+  schemas = {table: set(read_schema_names(directory, table, file_format)) for table in list_tables(directory, file_format)}
+
+  return join_flat_columns(schemas, columns, lambda table, table_columns: read_table(directory, table, table_columns, file_format))
+
+
+
+def select_flat_columns(tables: dict, columns: list) -> pd.DataFrame:
+  """Same as read_flat_columns on in-memory pyarrow tables by name, such as the tables built by
+  edi_parsing/utils/arrow_utils.py build_segments_groups_tables."""
+
+  schemas = {table: set(arrow_table.schema.names) for table, arrow_table in tables.items()}
+
+  return join_flat_columns(schemas, columns, lambda table, table_columns: tables[table].select([ID_COLUMN, PARENT_ID_COLUMN, *table_columns]).to_pandas())
+
+
+
+def join_flat_columns(schemas: dict, columns: list, read_columns) -> pd.DataFrame:
+  """Joins dotted columns of the tables whose column names are given by schemas, read_columns(table, columns) returning
+  a table columns and its join keys as a dataframe. See read_flat_columns."""
+
+  tables = list(schemas)
+
+  if ROOT_TABLE not in schemas:
+    raise ValueError(f"The tables have no {ROOT_TABLE} table, found {tables}")
+
+  # The root table is always read, so that there is one row by segments group even when none of the columns exist
+  tables_columns = {ROOT_TABLE: []}
+  for column in columns:
+    table, table_column = get_column_table(column, tables)
+    if table_column in schemas.get(table, ()):
+      tables_columns.setdefault(table, []).append(table_column)
+
+  # Parents of the read tables must be joined too
+  for table in list(tables_columns):
+    while table != ROOT_TABLE:
+      table = get_column_table(table, [t for t in tables if t != table])[0]
+      tables_columns.setdefault(table, [])
+
+  df = None
+  for table in sorted(tables_columns, key=lambda table: (table != ROOT_TABLE, table.count("."), table)):
+    df_table = read_columns(table, tables_columns[table])
+    logger.debug("Read %s columns and %s rows of table %s", len(tables_columns[table]), len(df_table), table)
+
+    if table == ROOT_TABLE:
+      df = df_table.rename(columns={ID_COLUMN: f"{ROOT_TABLE}.{ID_COLUMN}"}).drop(columns=PARENT_ID_COLUMN)
+      continue
+
+    parent = get_column_table(table, [t for t in tables if t != table])[0]
+    df_table = df_table.rename(columns={column: f"{table}.{column}" for column in df_table.columns})
+    df = df.merge(df_table, how="left", left_on=f"{parent}.{ID_COLUMN}", right_on=f"{table}.{PARENT_ID_COLUMN}")
+
+  return df.drop(columns=[column for column in df.columns if column.endswith((f".{ID_COLUMN}", f".{PARENT_ID_COLUMN}"))])
+
+
+
+def read_schema_names(directory: str, table: str, file_format: str = "parquet") -> list:
+
+  path = os.path.join(directory, f"{table}{TABLES_FORMATS[file_format]}")
+
+  if file_format == "parquet":
+    return pq.read_schema(path).names
+
+  with pa.memory_map(path) as source:
+    return pa.ipc.open_file(source).schema.names
@@ -1,5 +1,11 @@
+import logging
+
 import numpy as np
 
+
+logger = logging.getLogger(__name__)
+
+
 def is_not_null(row):
   """Check if the row value is not null. (a row is the value you get when doing df[col].apply(lambda row: ...))"""
 
@@ -91,8 +97,7 @@ def get_duplicate_columns_with_different_values(df, keys):
       if df.groupby(keys)[col].nunique().max() > 1:
           different_value_columns.append(col)
 
-  print("\nColumns with different values in duplicate rows:")
-  print(different_value_columns)
+  logger.debug("Columns with different values in duplicate rows: %s", different_value_columns)
 
   return different_value_columns
 
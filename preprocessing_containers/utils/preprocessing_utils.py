@@ -1,5 +1,11 @@
+import logging
+
 from utils import pandas_utils
 import pandas as pd
+from pandas.api.types import is_float_dtype
+
+
+logger = logging.getLogger(__name__)
 
 
 def preprocessess_stack_data(df_stacks, stack_id_columns):
@@ -7,19 +13,19 @@ def preprocessess_stack_data(df_stacks, stack_id_columns):
     """Read stack data and ensure Bay, Row, FirsTier, Subbay have the correct format.
        Create HatchSection column from Subbay"""
 
-    print("Assure que la colonne Bay a 3 chiffres en ajoutant des zéros à gauche si nécessaire (BBB)")
+    logger.info("Assure que la colonne Bay a 3 chiffres en ajoutant des zéros à gauche si nécessaire (BBB)")
     df_stacks["Bay"] = df_stacks["Bay"].str.zfill(3)
 
-    print("Assure que la colonne Row a 2 chiffres en ajoutant des zéros à gauche si nécessaire (RR)")
+    logger.info("Assure que la colonne Row a 2 chiffres en ajoutant des zéros à gauche si nécessaire (RR)")
     df_stacks["Row"] = df_stacks["Row"].str.zfill(2)
 
-    print("Assure que la colonne FirstTier a 2 chiffres en ajoutant des zéros à gauche si nécessaire (TT)")
+    logger.info("Assure que la colonne FirstTier a 2 chiffres en ajoutant des zéros à gauche si nécessaire (TT)")
     df_stacks["FirstTier"] = df_stacks["FirstTier"].str.zfill(2)
 
-    print("Assure que la colonne SubBay a 4 chiffres en ajoutant des zéros à gauche si nécessaire (SSSS)")
+    logger.info("Assure que la colonne SubBay a 4 chiffres en ajoutant des zéros à gauche si nécessaire (SSSS)")
     df_stacks["SubBay"] = df_stacks["SubBay"].str.zfill(4)
 
-    print("Extrait les trois premiers chiffres de SubBay pour créer la colonne HatchSection")
+    logger.info("Extrait les trois premiers chiffres de SubBay pour créer la colonne HatchSection")
     df_stacks["HatchSection"] = df_stacks["SubBay"].str[:-1]
 
 
@@ -35,26 +41,26 @@ def preprocessess_stack_data(df_stacks, stack_id_columns):
 
 
     # Renomme la colonne Tier en MacroTier
-    print("Renomme la colonne Tier en MacroTier")
+    logger.info("Renomme la colonne Tier en MacroTier")
     df_stacks = df_stacks.rename(columns={"Tier": "MacroTier"}).reset_index(drop=True)
 
     df_stacks["MacroRow"] = [ int(str(sb)[-2:-1]) for sb in df_stacks["SubBay"] ]
 
     # Crée la colonne Stack à partir de SubBay et Row
-    print(f"Crée la colonne Stack à partir de {stack_id_columns}")
+    logger.info("Crée la colonne Stack à partir de %s", stack_id_columns)
     
     concat_stack_columns = lambda row: "".join([str(row[c]) for c in stack_id_columns])
 
     df_stacks["Stack"] = df_stacks.apply(concat_stack_columns, axis=1)
 
 
-    print(f"Crée la colonne First_20_40_Stack à partir de {stack_id_columns}")
+    logger.info("Crée la colonne First_20_40_Stack à partir de %s", stack_id_columns)
     df_stacks["First_20_40_Stack"] = df_stacks.apply(lambda x: concat_stack_columns(x) if x["Bay"] in macrobay_map[x["MacroBay"]][:2] else -1, axis=1)
 
-    print(f"Crée la colonne Second_20_40_Stack à partir de {stack_id_columns}")
+    logger.info("Crée la colonne Second_20_40_Stack à partir de %s", stack_id_columns)
     df_stacks["Second_20_40_Stack"] = df_stacks.apply(lambda x: concat_stack_columns(x) if x["Bay"] in macrobay_map[x["MacroBay"]][1:] else -1, axis=1)
 
-    print(f"Crée la colonne MacroStack à partir de ['MacroBay', 'Row']")
+    logger.info("Crée la colonne MacroStack à partir de ['MacroBay', 'Row']")
     df_stacks["MacroStack"] = df_stacks.apply(lambda row: "".join([str(row[c]) for c in ['MacroBay', 'Row']]), axis=1)
 
     return df_stacks
@@ -85,7 +91,7 @@ def compute_bay_row_and_tier(df):
     """Compute Bay, Row, and Tier and MacroTier columns from Slot column."""
 
     # Extraction des informations de Bay, Row, et Tier à partir de la colonne Slot
-    print("Extraction des informations de Bay, Row, et Tier à partir de la colonne Slot")
+    logger.info("Extraction des informations de Bay, Row, et Tier à partir de la colonne Slot")
 
 
     df_filled = df.copy()
@@ -99,7 +105,7 @@ def compute_bay_row_and_tier(df):
 
 
     # Application de la fonction pour créer la colonne MacroTier
-    print("Application de la fonction pour créer la colonne MacroTier")
+    logger.info("Application de la fonction pour créer la colonne MacroTier")
 
     df["MacroTier"] = df_filled["Slot"].apply(get_macro_tier)
 
@@ -149,10 +155,13 @@ def convert_measure(value, unit_code, unit_code_map):
 def convert_measure_column(value_column, unit_code_column, unit_code_map, float_digits = None):
   """Convert measure column values to meters (or centimeters depending on unit_code_map given) or kilograms."""
 
+  # Measures are decoded to floats by the parser, only raw string columns need a conversion
+  values = value_column.fillna(0) if is_float_dtype(value_column) else value_column.fillna(0).astype(float)
+
   if type(unit_code_column) == str:
-    result = value_column.fillna(0).astype(float) * unit_code_map[unit_code_column]
+    result = values * unit_code_map[unit_code_column]
   else:
-    result = value_column.fillna(0).astype(float) * unit_code_column.map(unit_code_map)
+    result = values * unit_code_column.map(unit_code_map)
 
   if float_digits is not None:
     return result.round(float_digits)
@@ -186,8 +195,7 @@ def get_duplicate_columns_with_different_values(df, keys):
       if df.groupby(keys)[col].nunique().max() > 1:
           different_value_columns.append(col)
 
-  print("\nColumns with different values in duplicate rows:")
-  print(different_value_columns)
+  logger.debug("Columns with different values in duplicate rows: %s", different_value_columns)
 
   return different_value_columns
 
@@ -213,12 +221,12 @@ def aggregate_duplicates(df_with_duplicates, aggregation_functions, default_aggr
       keys = ["Container", "Slot"],
   )
 
-  print(f"Source columns: {list(df_with_duplicates.columns)}")
-  print(f"Duplicated columns: {list(duplicated_columns)}")
+  logger.debug("Source columns: %s", list(df_with_duplicates.columns))
+  logger.debug("Duplicated columns: %s", list(duplicated_columns))
 
   other_columns = [col for col in df_with_duplicates.columns if col not in duplicated_columns]
 
-  print(f"Other columns: {list(other_columns)}")
+  logger.debug("Other columns: %s", other_columns)
 
   return (
       df_with_duplicates
@@ -0,0 +1,130 @@
+import os
+import time
+import glob
+import fnmatch
+import logging
+import argparse
+
+import batch
+import pipeline
+
+
+# Input files of a simulation directory which trigger a run when they are added or changed
+WATCHED_FILES_PATTERNS = (os.path.join("in", "rotation.csv"), os.path.join("in", "*", "*.edi"))
+
+parser = argparse.ArgumentParser(description="Watches the data/simulations directories and builds the containers.csv of a simulation (see pipeline.py) once its .edi or rotation.csv files are added or changed. The referential data and the segments groups of the previous runs are kept in memory, so that revisions only parse the changed segments groups")
+parser.add_argument("simulations", type=str, nargs="*", default=["simulation_*_*"], help="Globs over the data/simulations directories names of the simulations to watch (e.g. 'simulation_1*_prod'), all by default")
+parser.add_argument("--interval", type=float, default=0.5, help="Seconds between two scans of the simulations files")
+parser.add_argument("--debounce", type=float, default=1.0, help="Seconds without changes of its files after which a simulation is run, so that files still being written (e.g. by other_files/get_simulation.sh) are not read")
+parser.add_argument("--run-existing", action="store_true", help="Also run the simulations already there when the watcher starts, which makes their first revisions fast. Otherwise they are only run once changed")
+parser.add_argument("--raw-text", type=str, default="omit", choices=list(pipeline.runner.RAW_TEXT_COLUMNS), help="See pipeline.py --raw-text")
+parser.add_argument("--handoff", type=str, default="auto", choices=pipeline.HANDOFFS, help="See pipeline.py --handoff")
+parser.add_argument("--full-parse", action="store_true", help="See pipeline.py --full-parse")
+parser.add_argument("--debug-json", action="store_true", help="See pipeline.py --debug-json")
+parser.add_argument("--log-level", type=str, default="WARNING", choices=pipeline.logging_utils.LOG_LEVELS, help="Log level of all modules")
+parser.add_argument("--log-module", type=str, action="append", default=[], help="Log level of one module, as module=LEVEL (e.g. pipeline=INFO). Can be repeated")
+
+logger = logging.getLogger("watch")
+
+
+class SimulationsWatcher:
+    """Polls the watched files of the simulations directories matching patterns. A simulation is ready once its files were added
+    or changed and then left unchanged for debounce seconds."""
+
+    def __init__(self, simulations_dir, patterns=("simulation_*_*",), debounce=1.0):
+        self.simulations_dir = simulations_dir
+        self.patterns = patterns
+        self.debounce = debounce
+        self.files = self.scan()
+        # Time of the last change of the files of each changed simulation, by (simulation, env)
+        self.pending = {}
+
+    def scan(self):
+        """Returns the signature (see pipeline.get_file_signature) of the watched files, by path."""
+        files = {}
+
+        for name in os.listdir(self.simulations_dir):
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns) or not batch.SIMULATION_DIR_PATTERN.fullmatch(name):
+                continue
+
+            for files_pattern in WATCHED_FILES_PATTERNS:
+                for path in glob.glob(os.path.join(self.simulations_dir, name, files_pattern)):
+                    signature = pipeline.get_file_signature(path)
+                    if signature is not None:
+                        files[path] = signature
+
+        return files
+
+    def get_simulation(self, path):
+        name = os.path.relpath(path, self.simulations_dir).split(os.sep)[0]
+        return batch.SIMULATION_DIR_PATTERN.fullmatch(name).groups()
+
+    def add_pending(self, simulations):
+        now = time.monotonic()
+        for simulation in simulations:
+            self.pending[simulation] = now
+
+    def poll(self):
+        """Scans the watched files, returns the (simulation, env) ready to run with the time of the last change of their files."""
+        files = self.scan()
+        changed = [path for path, signature in files.items() if self.files.get(path) != signature]
+        self.files = files
+
+        for path in changed:
+            logger.debug("%s changed", path)
+        self.add_pending({self.get_simulation(path) for path in changed})
+
+        now = time.monotonic()
+        ready = [(simulation, changed_time) for simulation, changed_time in self.pending.items() if now - changed_time >= self.debounce]
+        for simulation, _ in ready:
+            del self.pending[simulation]
+
+        return ready
+
+
+def watch(simulations_dir, patterns, interval=0.5, debounce=1.0, run_existing=False, **pipeline_options):
+    """Runs the pipeline of the watched simulations as their files change, until interrupted. Each simulation keeps
+    its pipeline state (see pipeline.run_pipeline) between runs, in memory."""
+    batch.initialize_batch_worker()
+
+    watcher = SimulationsWatcher(simulations_dir, patterns, debounce)
+    states = {}
+
+    if run_existing:
+        watcher.add_pending({watcher.get_simulation(path) for path in watcher.files})
+
+    logger.info("Watching %s files of %s simulations in %s", len(watcher.files), len({watcher.get_simulation(path) for path in watcher.files}), simulations_dir)
+
+    while True:
+        for (simulation, env), changed_time in watcher.poll():
+            summary = batch.run_simulation_job(simulation, env, state=states.setdefault((simulation, env), {}), **pipeline_options)
+
+            log = logger.info if summary["status"] == "ok" else logger.error
+            log(
+                "Simulation %s %s %s in %ss, %.3fs after the last change of its files %s",
+                simulation, env, summary["status"], summary["duration"], time.monotonic() - changed_time, summary.get("error", ""),
+            )
+
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    pipeline.logging_utils.configure_logging(args.log_level, {"watch": "INFO", **pipeline.logging_utils.parse_module_levels(args.log_module)})
+
+    try:
+        watch(
+            batch.SIMULATIONS_DIR,
+            args.simulations,
+            interval=args.interval,
+            debounce=args.debounce,
+            run_existing=args.run_existing,
+            raw_text=args.raw_text,
+            handoff=args.handoff,
+            full_parse=args.full_parse,
+            debug_json=args.debug_json,
+        )
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")